@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
 application = get_asgi_application()
+
+from foods.sse import with_events  # noqa: E402
+
+application = with_events(application)
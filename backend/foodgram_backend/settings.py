@@ -38,6 +38,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'foods.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,6 +75,16 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -107,6 +118,41 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = BASE_DIR / 'media'
 
+SHOPPING_LIST_ROOT = BASE_DIR / 'shopping_lists'
+
+SHOPPING_LIST_INTERNAL_URL = '/internal/shopping_lists/'
+
+SHOPPING_LIST_ACCEL_REDIRECT = os.getenv(
+    'SHOPPING_LIST_ACCEL_REDIRECT', 'False') == 'True'
+
+IMAGE_UPLOAD_ROOT = BASE_DIR / 'uploads'
+
+IMAGE_UPLOAD_MAX_SIZE = 30 * 1024 * 1024
+
+RECIPE_READ_MODEL = os.getenv('RECIPE_READ_MODEL', 'True') == 'True'
+
+EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', 'foods.events.PostgresBroker')
+
+EVENTS_HEARTBEAT = int(os.getenv('EVENTS_HEARTBEAT', 15))
+
+EVENTS_RETRY = int(os.getenv('EVENTS_RETRY', 5))
+
+EVENTS_REFRESH = int(os.getenv('EVENTS_REFRESH', 60))
+
+EVENTS_TICKET_AGE = 30
+
+# Интервал замеров стека при профилировании запроса, мс.
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', 5))
+
+# Лимиты времени SQL-запросов по областям вьюсетов, мс.
+STATEMENT_TIMEOUTS = {
+    'recipe_list': int(os.getenv('STATEMENT_TIMEOUT_RECIPE_LIST', 3000)),
+    'recipe_detail': int(os.getenv('STATEMENT_TIMEOUT_RECIPE_DETAIL', 1000)),
+    'what_to_cook': int(os.getenv('STATEMENT_TIMEOUT_WHAT_TO_COOK', 5000)),
+    'shopping_cart_download': int(os.getenv(
+        'STATEMENT_TIMEOUT_SHOPPING_CART_DOWNLOAD', 10000)),
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -114,7 +160,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'foods.profiling.RequestTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -122,7 +168,19 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': [
         'foods.pagination.DefaultPaginator',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'foods.throttling.TokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'shopping_cart_download': os.getenv(
+            'THROTTLE_SHOPPING_CART_DOWNLOAD', '10/min'),
+        'recipe_create': os.getenv('THROTTLE_RECIPE_CREATE', '30/hour'),
+        'ingredient_list': os.getenv('THROTTLE_INGREDIENT_LIST', '120/min'),
+    },
     'PAGE_SIZE': 6,
+    # Перед backend стоит один nginx, он передаёт адрес клиента в
+    # X-Forwarded-For.
+    'NUM_PROXIES': 1,
     'SEARCH_PARAM': 'name',
 }
 
@@ -10,7 +10,29 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
 application = get_wsgi_application()
+
+# Django загружает URLconf с представлениями при первом запросе. Загружаем
+# его сразу, чтобы при gunicorn --preload модули импортировались один раз
+# в мастер-процессе, а воркеры делили их страницы памяти после fork.
+get_resolver().url_patterns
+
+# Индекс для what_to_cook тоже строится в мастер-процессе: иначе каждый
+# воркер читал бы всю таблицу ингредиентов на первом запросе, внутри его
+# statement_timeout, а остальные потоки ждали бы. Соединение с базой
+# закрывается до fork, чтобы воркеры не делили его.
+from recipes.ingredient_index import ingredient_index  # noqa: E402
+
+try:
+    ingredient_index.warm()
+except DatabaseError:
+    # База ещё не готова, например до migrate: индекс построится при
+    # первом запросе.
+    pass
+finally:
+    connections.close_all()
@@ -0,0 +1,82 @@
+import hashlib
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+GENERATION_KEY = 'recipes_generation'
+RESPONSE_CACHE_TIMEOUT = 60 * 10
+STALE_RESPONSE_TIMEOUT = 60 * 60 * 24
+STALE_WARNING = '110 - "Response is Stale"'
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+def bump_generation():
+    """Делает недействительными все закэшированные ответы сразу."""
+    cache.add(GENERATION_KEY, 1, None)
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def response_cache_key(request, stale=False):
+    params = sorted(
+        (key, sorted(value for value in values if value))
+        for key, values in request.query_params.lists()
+    )
+    digest = hashlib.md5(
+        repr((request.get_host(), request.path, params)).encode()
+    ).hexdigest()
+    if stale:
+        # Последний удачный ответ переживает смену поколения.
+        return f'recipes_stale_{request.accepted_renderer.format}_{digest}'
+    return (f'recipes_response_{get_generation()}_'
+            f'{request.accepted_renderer.format}_{digest}')
+
+
+def stale_response(request):
+    """Последний удачный ответ анонимному GET-запросу или None."""
+    if request.method != 'GET' or request.user.is_authenticated:
+        return None
+    cached = cache.get(response_cache_key(request, stale=True))
+    if cached is None:
+        return None
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['Warning'] = STALE_WARNING
+    return response
+
+
+def store_response(key, stale_key, rendered):
+    cached = (rendered.content, rendered['Content-Type'])
+    cache.set(key, cached, RESPONSE_CACHE_TIMEOUT)
+    cache.set(stale_key, cached, STALE_RESPONSE_TIMEOUT)
+
+
+def cache_anonymous_response(view_method):
+    """Кэширует отрендеренный ответ на анонимный GET-запрос."""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        key = response_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == 200:
+            stale_key = response_cache_key(request, stale=True)
+            response.add_post_render_callback(
+                lambda rendered: store_response(key, stale_key, rendered)
+            )
+        return response
+    return wrapper
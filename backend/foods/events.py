@@ -0,0 +1,130 @@
+import asyncio
+import json
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+QUEUE_SIZE = 100
+CHANNEL = 'foodgram_recipes'
+RECONNECT_DELAY = 5
+
+
+class LocalBroker:
+    """Рассылка событий внутри одного процесса."""
+
+    def __init__(self):
+        self.listeners = defaultdict(set)
+        self.authors = {}
+        self.loop = None
+
+    @asynccontextmanager
+    async def listen(self, authors):
+        self.loop = asyncio.get_running_loop()
+        await self.start()
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.follow(queue, authors)
+        try:
+            yield queue
+        finally:
+            self.follow(queue, ())
+            del self.authors[queue]
+
+    def follow(self, queue, authors):
+        """Заменяет набор авторов, события которых получает queue."""
+        authors = set(authors)
+        previous = self.authors.get(queue, set())
+        for author in previous - authors:
+            self.listeners[author].discard(queue)
+            if not self.listeners[author]:
+                del self.listeners[author]
+        for author in authors - previous:
+            self.listeners[author].add(queue)
+        self.authors[queue] = authors
+
+    async def start(self):
+        pass
+
+    def publish(self, event):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.dispatch, event)
+
+    def dispatch(self, event):
+        for queue in self.listeners.get(event['author'], ()):
+            # Медленный клиент теряет события, а не копит их в памяти.
+            if not queue.full():
+                queue.put_nowait(event)
+
+
+class PostgresBroker(LocalBroker):
+    """Рассылка через LISTEN/NOTIFY, одно соединение на процесс."""
+
+    def __init__(self):
+        super().__init__()
+        self.listener = None
+        self.connecting = None
+
+    def publish(self, event):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(event)]
+            )
+
+    async def start(self):
+        await asyncio.shield(self.start_listening())
+
+    def start_listening(self):
+        if self.connecting is None:
+            self.connecting = self.loop.run_in_executor(None, self.connect)
+            self.connecting.add_done_callback(self.connected)
+        return self.connecting
+
+    @staticmethod
+    def connect():
+        import psycopg2
+
+        listener = psycopg2.connect(**connection.get_connection_params())
+        listener.autocommit = True
+        with listener.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return listener
+
+    def connected(self, future):
+        if future.cancelled() or future.exception() is not None:
+            self.reconnect()
+            return
+        self.listener = future.result()
+        self.loop.add_reader(self.listener.fileno(), self.receive)
+
+    def reconnect(self):
+        self.connecting = None
+        if self.listeners:
+            self.loop.call_later(RECONNECT_DELAY, self.start_listening)
+
+    def receive(self):
+        try:
+            self.listener.poll()
+        except Exception:
+            self.loop.remove_reader(self.listener.fileno())
+            self.listener.close()
+            self.listener = None
+            self.reconnect()
+            return
+        while self.listener.notifies:
+            self.dispatch(json.loads(self.listener.notifies.pop(0).payload))
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENTS_BACKEND)()
+
+
+def publish_recipe(recipe):
+    get_broker().publish({
+        'id': recipe.id,
+        'name': recipe.name,
+        'author': recipe.author_id
+    })
@@ -0,0 +1,62 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+from recipes.images import (
+    decode_data_uri,
+    file_digest,
+    store_image,
+    upload_path
+)
+from recipes.models import ImageUpload
+
+
+class HashedImageField(serializers.ImageField):
+    """Картинка в base64, файлом или токеном загрузки /api/uploads/.
+
+    Хранится под хэшем содержимого. Ссылку на уже сохранённую картинку,
+    которую фронтенд присылает при редактировании, поле пропускает, как
+    и Base64ImageField.
+    """
+    default_error_messages = {
+        'incomplete': 'Загрузка картинки ещё не завершена.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('http'):
+            raise SkipField()
+        digest = None
+        if isinstance(data, str) and data.startswith('data:'):
+            try:
+                data, digest = decode_data_uri(data)
+            except ValueError:
+                self.fail('invalid')
+        elif isinstance(data, str):
+            upload = self.get_upload(data)
+            # Токен гасится, когда рецепт с картинкой сохранён.
+            self.context.setdefault('image_uploads', []).append(upload)
+            data = File(open(upload_path(upload), 'rb'), name=upload.filename)
+        try:
+            image = super().to_internal_value(data)
+            return store_image(
+                image,
+                digest or file_digest(image),
+                image.image.format.lower()
+            )
+        finally:
+            if hasattr(data, 'close'):
+                data.close()
+
+    def get_upload(self, token):
+        try:
+            upload = ImageUpload.objects.filter(
+                token=token, user=self.context['request'].user
+            ).first()
+        except DjangoValidationError:
+            upload = None
+        if upload is None:
+            self.fail('invalid')
+        if upload.received != upload.size:
+            self.fail('incomplete')
+        return upload
@@ -0,0 +1,46 @@
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = 'fields'
+
+
+def requested_fields(request):
+    """Поля из параметра fields (через запятую) или None, если его нет."""
+    if request is None or FIELDS_PARAM not in request.query_params:
+        return None
+    return {
+        name.strip()
+        for value in request.query_params.getlist(FIELDS_PARAM)
+        for name in value.split(',')
+        if name.strip()
+    }
+
+
+def selected_fields(request, available):
+    """Имена из available, которые нужно отдать в ответ на запрос."""
+    fields = requested_fields(request)
+    if fields is None:
+        return set(available)
+    unknown = fields - set(available)
+    if unknown:
+        raise ValidationError({
+            FIELDS_PARAM: f'Неизвестные поля: {", ".join(sorted(unknown))}'
+        })
+    return fields
+
+
+class SparseFieldsMixin:
+    """Отдаёт только поля из параметра fields; вложенные — целиком."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        selected = selected_fields(self.context.get('request'), fields)
+        return {
+            name: field for name, field in fields.items()
+            if name in selected
+        }
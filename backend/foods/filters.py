@@ -1,6 +1,15 @@
 from django_filters.rest_framework import filters, FilterSet
 from recipes.models import Ingredient, Recipe, Tag
 
+# Каждому порядку соответствует индекс с тем же набором полей, так что
+# страница читается по индексу без сортировки всей выборки.
+RECIPE_ORDERINGS = {
+    'newest': ('-pub_date',),
+    'cooking_time': ('cooking_time', '-pub_date'),
+    'name': ('name', '-pub_date'),
+    'favorites': ('-favorites_count', '-pub_date'),
+}
+
 
 class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
@@ -8,10 +17,52 @@ class RecipeFilter(FilterSet):
         to_field_name='slug',
         queryset=Tag.objects.all()
     )
+    ingredients = filters.ModelMultipleChoiceFilter(
+        queryset=Ingredient.objects.all(),
+        method='get_ingredients'
+    )
+    exclude_ingredients = filters.ModelMultipleChoiceFilter(
+        queryset=Ingredient.objects.all(),
+        method='get_exclude_ingredients'
+    )
+    min_cooking_time = filters.NumberFilter(
+        field_name='cooking_time',
+        lookup_expr='gte'
+    )
+    max_cooking_time = filters.NumberFilter(
+        field_name='cooking_time',
+        lookup_expr='lte'
+    )
+    ordering = filters.ChoiceFilter(
+        choices=[(ordering, ordering) for ordering in RECIPE_ORDERINGS],
+        method='get_ordering'
+    )
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart')
 
+    @staticmethod
+    def get_ingredients(queryset, name, value):
+        # Recipe.ingredient_ids с GIN-индексом вместо JOIN по
+        # RecipeIngredient, который размножает строки рецептов.
+        if not value:
+            return queryset
+        return queryset.filter(
+            ingredient_ids__contains=[ingredient.id for ingredient in value]
+        )
+
+    @staticmethod
+    def get_exclude_ingredients(queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.exclude(
+            ingredient_ids__overlap=[ingredient.id for ingredient in value]
+        )
+
+    @staticmethod
+    def get_ordering(queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated:
             return queryset.filter(favorites__user=self.request.user)
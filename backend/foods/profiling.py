@@ -0,0 +1,157 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from recipes.models import RequestProfile
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+PROFILE_PERMISSION = 'recipes.add_requestprofile'
+MAX_QUERIES = 1000
+SQL_FRAME_LENGTH = 200
+
+
+def frame_name(frame):
+    return (f'{frame.f_globals.get("__name__", "?")}.'
+            f'{frame.f_code.co_name}').replace(';', ',')
+
+
+def fold(frame, leaf=None):
+    """Стек в формате folded: кадры от корня через точку с запятой."""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    if leaf:
+        names.append(leaf)
+    return ';'.join(names)
+
+
+class Sampler(threading.Thread):
+    """Раз в interval секунд снимает стек потока запроса."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.query = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                query = self.query
+                self.stacks[fold(frame, query and f'SQL {query}')] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class QueryRecorder:
+    """Обёртка запросов: записывает SQL и его время, отмечает его в Sampler."""
+
+    def __init__(self, sampler):
+        self.sampler = sampler
+        self.queries = []
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.sampler.query = ' '.join(
+            sql.split()
+        )[:SQL_FRAME_LENGTH].replace(';', ',')
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            self.sampler.query = None
+            self.count += 1
+            self.duration += duration
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append(
+                    {'sql': sql, 'duration': round(duration, 3)}
+                )
+
+
+class RequestTokenAuthentication(TokenAuthentication):
+    """Не проверяет повторно токен, уже проверенный ProfilingMiddleware."""
+
+    def authenticate(self, request):
+        authenticated = getattr(request._request, 'token_authenticated', None)
+        if authenticated is not None:
+            return authenticated
+        return super().authenticate(request)
+
+
+def profiling_user(request):
+    """Сотрудник с правом на профилирование или None."""
+    user = request.user
+    if not user.is_authenticated:
+        try:
+            authenticated = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        if authenticated is None:
+            return None
+        request.token_authenticated = authenticated
+        user = authenticated[0]
+    if user.is_staff and user.has_perm(PROFILE_PERMISSION):
+        return user
+    return None
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос сотрудника с заголовком X-Profile или ?profile=1."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (request.META.get(PROFILE_HEADER)
+                or request.GET.get(PROFILE_PARAM) == '1'):
+            return self.get_response(request)
+        user = profiling_user(request)
+        if user is None:
+            return self.get_response(request)
+        return self.profile(request, user)
+
+    def profile(self, request, user):
+        sampler = Sampler(
+            threading.get_ident(), settings.PROFILING_INTERVAL / 1000
+        )
+        recorder = QueryRecorder(sampler)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        profile = RequestProfile.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path(),
+            status_code=response.status_code,
+            duration=(time.perf_counter() - started) * 1000,
+            query_count=recorder.count,
+            query_duration=recorder.duration,
+            samples=sum(sampler.stacks.values()),
+            stacks='\n'.join(
+                f'{stack} {count}'
+                for stack, count in sampler.stacks.most_common()
+            ),
+            queries=recorder.queries
+        )
+        response['X-Profile-Id'] = str(profile.pk)
+        return response
@@ -0,0 +1,65 @@
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection
+from django.http import Http404
+
+
+def target_pk(target_model, target_id):
+    try:
+        return target_model._meta.pk.to_python(target_id)
+    except ValidationError:
+        raise Http404
+
+
+def add_relation(model, field, user, target_id):
+    """Создаёт связь одним запросом; возвращает объект и признак создания."""
+    target_model = model._meta.get_field(field).related_model
+    target_id = target_pk(target_model, target_id)
+    quote = connection.ops.quote_name
+    columns, values, params = [], [], []
+    for model_field in model._meta.concrete_fields:
+        if model_field.primary_key:
+            continue
+        columns.append(quote(model_field.column))
+        if model_field.name == field:
+            values.append(f'target.{quote(target_model._meta.pk.column)}')
+        elif model_field.name == 'user':
+            values.append('%s')
+            params.append(user.pk)
+        else:
+            values.append('%s')
+            params.append(model_field.get_db_prep_save(
+                model_field.get_default(), connection
+            ))
+    sql = (
+        f'WITH target AS ('
+        f'SELECT * FROM {quote(target_model._meta.db_table)} '
+        f'WHERE {quote(target_model._meta.pk.column)} = %s'
+        f'), inserted AS ('
+        f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(columns)}) '
+        f'SELECT {", ".join(values)} FROM target '
+        f'ON CONFLICT DO NOTHING RETURNING 1'
+        f') SELECT target.*, EXISTS(SELECT 1 FROM inserted) AS created '
+        f'FROM target'
+    )
+    try:
+        found = list(target_model.objects.raw(sql, [target_id, *params]))
+    except IntegrityError:
+        # Объект удалили между чтением и вставкой.
+        raise Http404
+    if not found:
+        raise Http404
+    return found[0], found[0].created
+
+
+def remove_relation(model, field, user, target_id):
+    """Удаляет связь одним DELETE; Http404, если нет самого объекта."""
+    target_model = model._meta.get_field(field).related_model
+    target_id = target_pk(target_model, target_id)
+    deleted, _ = model.objects.filter(
+        user=user, **{f'{field}_id': target_id}
+    ).delete()
+    if deleted:
+        return True
+    if not target_model.objects.filter(pk=target_id).exists():
+        raise Http404
+    return False
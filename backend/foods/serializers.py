@@ -1,22 +1,47 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from django.core.validators import validate_image_file_extension
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
 
+from recipes.images import finish_upload
 from recipes.models import (
     Favorite,
+    ImageUpload,
     Ingredient,
     RecipeIngredient,
     Tag,
     Recipe,
     ShoppingCart)
+from recipes.read_model import (
+    INGREDIENT_FIELDS,
+    TAG_FIELDS,
+    read_model_items,
+    rebuild_read_model
+)
 from users.models import Subscription, User
+from .fieldsets import SparseFieldsMixin
+from .fields import HashedImageField
+
+RECIPE_INTERNAL_FIELDS = (
+    'pub_date',
+    'updated',
+    'rendered',
+    'ingredient_ids',
+    'favorites_count'
+)
 
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
-        fields = '__all__'
+        # Тот же порядок, что и в Recipe.rendered, чтобы ответ не зависел
+        # от того, откуда прочитаны теги.
+        fields = TAG_FIELDS
         model = Tag
 
 
@@ -26,15 +51,17 @@ class IngredientSerializer(serializers.ModelSerializer):
         model = Ingredient
 
 
-class UserGetSerializer(UserCreateSerializer):
+class UserGetSerializer(SparseFieldsMixin, UserCreateSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        authenticated = self.context['request'].user.is_authenticated
-        subscribed = Subscription.objects.filter(
-            author=obj, user=self.context['request'].user
-        ).exists()
-        return authenticated and subscribed
+        user = self.context['request'].user
+        if user.is_anonymous:
+            return False
+        subscribed = getattr(obj, 'is_subscribed', None)
+        if subscribed is not None:
+            return subscribed
+        return Subscription.objects.filter(author=obj, user=user).exists()
 
     class Meta:
         fields = (
@@ -61,20 +88,27 @@ class UserPostSerializer(UserCreateSerializer):
         model = User
 
 
-class UserSubscriptionsSerializer(serializers.ModelSerializer):
+class UserSubscriptionsSerializer(
+    SparseFieldsMixin, serializers.ModelSerializer
+):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        authenticated = self.context['request'].user.is_authenticated
-        subscribed = Subscription.objects.filter(
-            author=obj, user=self.context['request'].user
-        ).exists()
-        return authenticated and subscribed
+        user = self.context['request'].user
+        if user.is_anonymous:
+            return False
+        subscribed = getattr(obj, 'is_subscribed', None)
+        if subscribed is not None:
+            return subscribed
+        return Subscription.objects.filter(author=obj, user=user).exists()
 
     @staticmethod
     def get_recipes_count(obj):
+        recipes_count = getattr(obj, 'recipes_count', None)
+        if recipes_count is not None:
+            return recipes_count
         return obj.recipes.count()
 
     def get_recipes(self, obj):
@@ -108,28 +142,6 @@ class UserSubscriptionsSerializer(serializers.ModelSerializer):
         )
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
-    def validate_author(self, author):
-        if self.context['request'].user == author:
-            raise serializers.ValidationError('Нельзя подписаться на себя')
-        return author
-
-    def to_representation(self, instance):
-        author = instance['author']
-        return UserSubscriptionsSerializer(author, context=self.context).data
-
-    class Meta:
-        fields = '__all__'
-        model = Subscription
-        validators = (
-            serializers.UniqueTogetherValidator(
-                queryset=Subscription.objects.all(),
-                fields=('user', 'author'),
-                message='Вы уже подписаны'
-            ),
-        )
-
-
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
@@ -139,7 +151,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = RecipeIngredient
-        fields = ('id', 'name', 'measurement_unit', 'amount')
+        fields = INGREDIENT_FIELDS
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -169,38 +181,68 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author = UserGetSerializer(read_only=True)
-    image = Base64ImageField()
-    tags = TagSerializer(many=True, read_only=True)
-    ingredients = RecipeIngredientSerializer(
-        many=True,
-        read_only=True,
-        source='recipes'
-    )
+    image = HashedImageField()
+    tags = serializers.SerializerMethodField()
+    ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
+    @staticmethod
+    def use_read_model(obj):
+        return settings.RECIPE_READ_MODEL and obj.rendered is not None
+
+    def get_tags(self, obj):
+        if self.use_read_model(obj):
+            return read_model_items(obj.rendered['tags'], TAG_FIELDS)
+        # Порядок по id, как в Recipe.rendered; сортировка в Python не
+        # ломает prefetch_related.
+        tags = sorted(obj.tags.all(), key=attrgetter('id'))
+        return TagSerializer(tags, many=True).data
+
+    def get_ingredients(self, obj):
+        if self.use_read_model(obj):
+            return read_model_items(
+                obj.rendered['ingredients'], INGREDIENT_FIELDS
+            )
+        ingredients = sorted(obj.recipes.all(), key=attrgetter('id'))
+        return RecipeIngredientSerializer(ingredients, many=True).data
+
     def get_is_favorited(self, obj):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        is_favorited = getattr(obj, 'is_favorited', None)
+        if is_favorited is not None:
+            return is_favorited
         return Favorite.objects.filter(user=user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
         user = self.context['request'].user
         if user.is_anonymous:
             return False
+        is_in_shopping_cart = getattr(obj, 'is_in_shopping_cart', None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
         return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
 
+    def to_representation(self, instance):
+        # Подписка на автора посчитана в запросе рецептов, вложенный
+        # UserGetSerializer берёт её из атрибута is_subscribed.
+        subscribed = getattr(instance, 'author_is_subscribed', None)
+        if subscribed is not None:
+            instance.author.is_subscribed = subscribed
+        return super().to_representation(instance)
+
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = RECIPE_INTERNAL_FIELDS
 
 
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     author = UserGetSerializer(read_only=True)
-    image = Base64ImageField()
+    image = HashedImageField()
     ingredients = RecipeIngredientCreateSerializer(many=True)
     tags = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -252,6 +294,8 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
+        self.rebuild_read_model(recipe)
+        self.finish_uploads()
         return recipe
 
     @transaction.atomic
@@ -269,15 +313,27 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                     amount=ingredient['amount']
                 ) for ingredient in ingredients]
             )
+        recipe = super().update(recipe, validated_data)
+        self.rebuild_read_model(recipe)
+        self.finish_uploads()
+        return recipe
+
+    def finish_uploads(self):
+        """Удаляет загрузки, ставшие картинкой рецепта, после коммита."""
+        for upload in self.context.get('image_uploads', ()):
+            transaction.on_commit(lambda upload=upload: finish_upload(upload))
 
-        return super().update(recipe, validated_data)
+    @staticmethod
+    def rebuild_read_model(recipe):
+        rebuild_read_model(Recipe.objects.filter(pk=recipe.pk))
+        recipe.refresh_from_db(fields=('rendered',))
 
     def to_representation(self, instance):
         return RecipeListSerializer(instance, context=self.context).data
 
     class Meta:
         model = Recipe
-        exclude = ('pub_date',)
+        exclude = RECIPE_INTERNAL_FIELDS
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
@@ -286,34 +342,33 @@ class RecipeMinifiedSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    def to_representation(self, instance):
-        recipe = instance['recipe']
-        return RecipeMinifiedSerializer(recipe, context=self.context).data
+class CookableRecipeSerializer(RecipeMinifiedSerializer):
+    covered = serializers.IntegerField(read_only=True)
+    missing = RecipeIngredientSerializer(many=True, read_only=True)
 
-    class Meta:
-        fields = ('user', 'recipe')
-        model = Favorite
-        validators = (
-            serializers.UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже в избранном'
-            ),
-        )
+    class Meta(RecipeMinifiedSerializer.Meta):
+        fields = RecipeMinifiedSerializer.Meta.fields + ('covered', 'missing')
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    def validate_recipe(self, data):
-        user = self.context['request'].user
-        if ShoppingCart.objects.filter(recipe=data, user=user).exists():
-            raise serializers.ValidationError('Рецепт уже есть в корзине')
-        return data
+class ImageUploadSerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='received', read_only=True)
 
-    def to_representation(self, instance):
-        recipe = instance['recipe']
-        return RecipeMinifiedSerializer(recipe).data
+    @staticmethod
+    def validate_filename(filename):
+        try:
+            validate_image_file_extension(File(None, name=filename))
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        return filename
+
+    @staticmethod
+    def validate_size(size):
+        if not 0 < size <= settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Размер должен быть от 1 до {settings.IMAGE_UPLOAD_MAX_SIZE}'
+            )
+        return size
 
     class Meta:
-        fields = ('user', 'recipe')
-        model = ShoppingCart
+        model = ImageUpload
+        fields = ('token', 'filename', 'size', 'offset')
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.db.models import F, Max, Sum
+from django.http import FileResponse, HttpResponse
+
+from recipes.models import IngredientChange, RecipeIngredient, ShoppingCart
+
+FILENAME = 'foodgram_shopping_cart.txt'
+CONTENT_TYPE = 'text/plain; charset=utf-8'
+
+
+def cart_digest(user):
+    """Хэш состояния корзины: рецепты, их версии и версия ингредиентов."""
+    state = sorted(ShoppingCart.objects.filter(user=user).values_list(
+        'recipe_id', 'recipe__updated'
+    ))
+    # Названия и единицы ингредиентов меняются без изменения рецептов.
+    version = IngredientChange.objects.aggregate(version=Max('id'))['version']
+    return hashlib.sha256(repr((version, state)).encode()).hexdigest()
+
+
+def render_shopping_list(user):
+    shopping_cart = RecipeIngredient.objects.filter(
+        recipe__shopping_carts__user=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        name=F('ingredient__name'),
+        units=F('ingredient__measurement_unit'),
+        total=Sum('amount')
+    ).order_by('-total')
+    return '\n'.join(
+        [f"{item.get('name')} ({item.get('units')}) - {item.get('total')}"
+         for item in shopping_cart]
+    )
+
+
+def shopping_list_file(user):
+    """Путь к файлу списка покупок, при необходимости создаёт его."""
+    digest = cart_digest(user)
+    relative = os.path.join(digest[:2], f'{digest}.txt')
+    path = os.path.join(settings.SHOPPING_LIST_ROOT, relative)
+    try:
+        # Время изменения служит отметкой последнего использования для
+        # команды clear_shopping_lists.
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            file.write(render_shopping_list(user))
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    return relative, path
+
+
+def shopping_list_response(user):
+    """Отдаёт список покупок через nginx, не пропуская тело через Django."""
+    relative, path = shopping_list_file(user)
+    if settings.SHOPPING_LIST_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=CONTENT_TYPE)
+        response['X-Accel-Redirect'] = (
+            settings.SHOPPING_LIST_INTERNAL_URL + relative.replace(os.sep, '/')
+        )
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename={FILENAME}'
+    return response
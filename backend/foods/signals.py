@@ -0,0 +1,41 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+from .caching import bump_generation
+from .events import publish_recipe
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_recipe_responses(sender, **kwargs):
+    # Иначе параллельный запрос успеет закэшировать ещё старые данные
+    # под новым поколением.
+    transaction.on_commit(bump_generation)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_responses(sender, created, update_fields, **kwargs):
+    # Новый пользователь ещё не может быть автором рецепта, а вход в
+    # систему меняет только last_login.
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    transaction.on_commit(bump_generation)
+
+
+@receiver(post_save, sender=Recipe)
+def notify_subscribers(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(publish_recipe, instance))
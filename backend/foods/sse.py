@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+from contextlib import AsyncExitStack
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import close_old_connections
+
+from .events import get_broker
+
+logger = logging.getLogger(__name__)
+
+EVENTS_PATH = '/api/events/'
+TICKET_SALT = 'foods.sse.ticket'
+
+
+def issue_ticket(user):
+    """Одноразовый подписанный билет для подключения к EVENTS_PATH."""
+    # EventSource не умеет слать заголовки, а токен в адресе попал бы в логи.
+    return signing.dumps(
+        {'user': user.pk, 'nonce': secrets.token_hex(8)}, salt=TICKET_SALT
+    )
+
+
+def ticket_user(ticket):
+    try:
+        payload = signing.loads(
+            ticket, salt=TICKET_SALT, max_age=settings.EVENTS_TICKET_AGE
+        )
+    except signing.BadSignature:
+        return None
+    if not cache.add(
+        f'events_ticket_{payload["nonce"]}', 1, settings.EVENTS_TICKET_AGE
+    ):
+        return None
+    return payload['user']
+
+
+@sync_to_async(thread_sensitive=False)
+def authenticate(headers, query_string):
+    """Id пользователя по заголовку Authorization или билету ?ticket=."""
+    from rest_framework.authtoken.models import Token
+
+    authorization = headers.get(b'authorization', b'').decode().split()
+    if len(authorization) == 2 and authorization[0] == 'Token':
+        close_old_connections()
+        try:
+            return Token.objects.filter(key=authorization[1]).values_list(
+                'user_id', flat=True
+            ).first()
+        finally:
+            close_old_connections()
+    ticket = parse_qs(query_string.decode()).get('ticket', [''])[0]
+    if ticket:
+        return ticket_user(ticket)
+    return None
+
+
+@sync_to_async(thread_sensitive=False)
+def followed_authors(user_id):
+    from users.models import Subscription
+
+    close_old_connections()
+    try:
+        return set(Subscription.objects.filter(
+            user_id=user_id
+        ).values_list('author_id', flat=True))
+    finally:
+        close_old_connections()
+
+
+async def send_error(send, status, detail, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers]
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'detail': detail}, ensure_ascii=False).encode()
+    })
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def events(scope, receive, send):
+    """Server-sent events о новых рецептах авторов из подписок."""
+    user_id = await authenticate(
+        dict(scope['headers']), scope['query_string']
+    )
+    if user_id is None:
+        await send_error(
+            send, 401, 'Учетные данные не были предоставлены.'
+        )
+        return
+    authors = await followed_authors(user_id)
+    broker = get_broker()
+    async with AsyncExitStack() as stack:
+        # Подписка на события до ответа: если LISTEN недоступен, клиент
+        # получит 503 с Retry-After, а не оборванный поток.
+        try:
+            queue = await stack.enter_async_context(broker.listen(authors))
+        except Exception:
+            await send_error(
+                send, 503, 'Сервис событий временно недоступен.',
+                [(b'retry-after', str(settings.EVENTS_RETRY).encode())]
+            )
+            return
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': f'retry: {settings.EVENTS_RETRY * 1000}\n\n'.encode(),
+            'more_body': True
+        })
+        disconnected = asyncio.ensure_future(wait_disconnect(receive))
+        refreshed = time.monotonic()
+        try:
+            while not disconnected.done():
+                received = asyncio.ensure_future(queue.get())
+                await asyncio.wait(
+                    (received, disconnected),
+                    timeout=settings.EVENTS_HEARTBEAT,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected.done():
+                    received.cancel()
+                    break
+                if received.done():
+                    event = received.result()
+                    body = (f'id: {event["id"]}\nevent: recipe\n'
+                            f'data: {json.dumps(event, ensure_ascii=False)}'
+                            f'\n\n')
+                else:
+                    received.cancel()
+                    body = ': heartbeat\n\n'
+                await send({
+                    'type': 'http.response.body',
+                    'body': body.encode(),
+                    'more_body': True
+                })
+                if time.monotonic() - refreshed >= settings.EVENTS_REFRESH:
+                    broker.follow(queue, await followed_authors(user_id))
+                    refreshed = time.monotonic()
+        finally:
+            disconnected.cancel()
+
+
+def with_events(application):
+    """Обрабатывает EVENTS_PATH до Django, остальное передаёт application."""
+    if isinstance(caches['default'], LocMemCache):
+        # Одноразовость билета держится на cache.add.
+        logger.warning(
+            'Кэш LocMem не общий для процессов: билет на события можно '
+            'использовать повторно в другом процессе. Укажите CACHE_BACKEND.'
+        )
+
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+            await events(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+    return router
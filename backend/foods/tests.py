@@ -0,0 +1,888 @@
+import asyncio
+import base64
+import fcntl
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.images import upload_path
+from recipes.models import (
+    Favorite,
+    ImageUpload,
+    Ingredient,
+    RecipeIngredient,
+    RecipePopularity,
+    RequestProfile,
+    ShoppingCart,
+    Tag
+)
+from recipes.tests import create_recipe, create_user
+from users.models import Subscription, User
+
+from .caching import STALE_WARNING, get_generation
+from .events import LocalBroker, get_broker
+from .shopping_list import cart_digest, render_shopping_list
+from .sse import authenticate, events, issue_ticket, ticket_user
+from .throttling import TokenBucketThrottle, gcra
+from .timeouts import QUERY_CANCELED, RETRY_AFTER
+from .views import RecipeViewSet, accepts_gzip
+
+LOCMEM_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class GcraTest(SimpleTestCase):
+    interval = 6000
+    burst = 60000
+
+    def test_new_bucket_takes_one_interval(self):
+        self.assertEqual(
+            gcra(None, 1000, self.interval, self.burst), (7000, 0)
+        )
+
+    def test_bucket_in_the_past_restarts_from_now(self):
+        self.assertEqual(
+            gcra(500, 100000, self.interval, self.burst), (106000, 0)
+        )
+
+    def test_burst_is_allowed_up_to_capacity(self):
+        arrival = None
+        for _ in range(10):
+            arrival, wait = gcra(arrival, 0, self.interval, self.burst)
+            self.assertEqual(wait, 0)
+        self.assertEqual(arrival, self.burst)
+
+    def test_over_capacity_reports_wait(self):
+        self.assertEqual(
+            gcra(self.burst, 0, self.interval, self.burst),
+            (None, self.interval)
+        )
+        self.assertEqual(
+            gcra(self.burst, 2000, self.interval, self.burst),
+            (None, self.interval - 2000)
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TokenBucketThrottleTest(SimpleTestCase):
+    rate = '10/min'
+
+    def setUp(self):
+        cache.clear()
+        self.throttle = TokenBucketThrottle()
+        self.throttle.cache = cache
+        self.throttle.key = 'throttle_test_user'
+        self.throttle.num_requests, self.throttle.duration = (
+            self.throttle.parse_rate(self.rate)
+        )
+
+    def take(self, now):
+        return self.throttle.take_token(6000, 60000, now)
+
+    def test_steady_client_keeps_configured_rate(self):
+        for second in range(0, 600, 6):
+            self.assertEqual(self.take(second * 1000), 0)
+
+    def test_burst_then_rejection(self):
+        for _ in range(10):
+            self.assertEqual(self.take(0), 0)
+        self.assertEqual(self.take(0), 6000)
+        self.assertEqual(self.take(6000), 0)
+
+    def test_timeout_covers_the_whole_bucket(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as set_value:
+            for _ in range(10):
+                self.take(0)
+        self.assertEqual(set_value.call_args.args[2], 60 + 60)
+        self.assertEqual(self.throttle.get_timeout(0, 5000), 60)
+
+    def test_memcached_bucket_is_replaced_with_cas(self):
+        client = mock.Mock()
+        client.gets.side_effect = [(6000, b'1'), (12000, b'2')]
+        client.cas.side_effect = [False, True]
+        self.throttle.cache = mock.Mock(_cache=client)
+        self.throttle.cache.make_key.return_value = 'key'
+        self.assertEqual(self.take(0), 0)
+        client.cas.assert_called_with('key', 18000, b'2', expire=78)
+        client.add.assert_not_called()
+
+
+def statements(queries):
+    # Точки сохранения ставит транзакция StatementTimeoutMixin внутри
+    # транзакции теста.
+    return [
+        query['sql'] for query in queries.captured_queries
+        if 'SAVEPOINT' not in query['sql']
+    ]
+
+
+def png_bytes():
+    image = io.BytesIO()
+    Image.new('RGB', (2, 2)).save(image, 'PNG')
+    return image.getvalue()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ImageUploadTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(root, 'media'),
+            IMAGE_UPLOAD_ROOT=os.path.join(root, 'uploads')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password',
+            first_name='Повар', last_name='Поваров'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.image = png_bytes()
+        response = self.client.post(
+            '/api/uploads/',
+            {'filename': 'dish.png', 'size': len(self.image)},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.upload = ImageUpload.objects.get(token=response.data['token'])
+        self.url = f'/api/uploads/{self.upload.token}/'
+
+    def put(self, data, offset):
+        return self.client.put(
+            self.url, data, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_wrong_offset_is_conflict(self):
+        self.assertEqual(self.put(self.image[:10], 0).status_code, 200)
+        response = self.put(self.image[10:], 5)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 10)
+
+    def test_concurrent_append_is_conflict(self):
+        with open(upload_path(self.upload), 'rb') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            response = self.put(self.image, 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 0)
+
+    def test_overflow_is_rejected(self):
+        self.assertEqual(self.put(self.image[:10], 0).status_code, 200)
+        response = self.put(self.image[10:] + b'extra', 10)
+        self.assertEqual(response.status_code, 400)
+        self.upload.refresh_from_db()
+        self.assertEqual(self.upload.received, 10)
+        self.assertEqual(os.path.getsize(upload_path(self.upload)), 10)
+
+    def test_completed_upload_is_retired_by_recipe(self):
+        self.assertEqual(self.put(self.image, 0).status_code, 200)
+        tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        recipe = {
+            'name': 'Яичница',
+            'text': 'Пожарить',
+            'cooking_time': 5,
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 1}],
+            'image': str(self.upload.token)
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/', recipe, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(
+            ImageUpload.objects.filter(token=self.upload.token).exists()
+        )
+        self.assertFalse(os.path.exists(upload_path(self.upload)))
+        response = self.client.post('/api/recipes/', recipe, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class PopularRecipesTest(TestCase):
+
+    def setUp(self):
+        author = create_user('author')
+        self.recipes = [create_recipe(author) for _ in range(3)]
+        for score, recipe in enumerate(self.recipes):
+            RecipePopularity.objects.create(recipe=recipe, score=score)
+
+    def test_recipes_are_ranked_by_score(self):
+        response = self.client.get('/api/recipes/popular/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe.pk for recipe in reversed(self.recipes)]
+        )
+
+    def test_ordering_is_rejected(self):
+        response = self.client.get('/api/recipes/popular/?ordering=name')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+
+
+class RelationToggleTest(TestCase):
+
+    def setUp(self):
+        self.user = create_user('reader')
+        self.author = create_user('author')
+        self.recipe = create_recipe(self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def toggle(self, method, url, queries):
+        with self.assertNumQueries(queries):
+            return getattr(self.client, method)(url)
+
+    def check_recipe_toggle(self, action, model, created_status, error):
+        url = f'/api/recipes/{self.recipe.pk}/{action}/'
+        response = self.toggle('post', url, 1)
+        self.assertEqual(response.status_code, created_status)
+        self.assertEqual(response.data['id'], self.recipe.pk)
+        self.assertTrue(model.objects.filter(
+            user=self.user, recipe=self.recipe
+        ).exists())
+        response = self.toggle('post', url, 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), error)
+        self.assertEqual(self.toggle('delete', url, 1).status_code, 204)
+        self.assertFalse(model.objects.filter(user=self.user).exists())
+
+    def test_favorite(self):
+        self.check_recipe_toggle(
+            'favorite', Favorite, 201,
+            {'non_field_errors': ['Рецепт уже в избранном']}
+        )
+
+    def test_shopping_cart(self):
+        self.check_recipe_toggle(
+            'shopping_cart', ShoppingCart, 200,
+            {'recipe': ['Рецепт уже есть в корзине']}
+        )
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['id'], self.author.pk)
+        response = self.toggle('post', url, 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'non_field_errors': ['Вы уже подписаны']}
+        )
+        self.assertEqual(self.toggle('delete', url, 1).status_code, 204)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_subscribe_to_self(self):
+        response = self.client.post(f'/api/users/{self.user.pk}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'author': ['Нельзя подписаться на себя']}
+        )
+
+    def test_missing_target(self):
+        for url in ('/api/recipes/0/favorite/', '/api/recipes/abc/favorite/',
+                    '/api/recipes/0/shopping_cart/',
+                    '/api/users/0/subscribe/', '/api/users/abc/subscribe/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.post(url).status_code, 404)
+                self.assertEqual(self.client.delete(url).status_code, 404)
+
+    def test_delete_missing_relation(self):
+        for url, error in (
+            (f'/api/recipes/{self.recipe.pk}/favorite/',
+             'Рецепта нет в избранном'),
+            (f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+             'Этого рецепта нет в списке покупок'),
+            (f'/api/users/{self.author.pk}/subscribe/',
+             'Вы не подписаны на этого автора'),
+        ):
+            with self.subTest(url=url):
+                response = self.toggle('delete', url, 2)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'errors': error})
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AnonymousResponseCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        self.recipe = create_recipe(self.author)
+        self.tag = Tag.objects.create(name='Ужин', slug='dinner')
+        self.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def queries(self, url, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        return response, len(statements(queries))
+
+    def assertBumps(self, change):
+        generation = get_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertGreater(get_generation(), generation)
+
+    def test_repeated_request_is_served_from_cache(self):
+        response, queries = self.queries('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(queries, 0)
+        cached, queries = self.queries('/api/recipes/')
+        self.assertEqual(queries, 0)
+        self.assertEqual(cached.content, response.content)
+
+    def test_parameter_order_does_not_change_key(self):
+        self.queries(f'/api/recipes/?author={self.author.pk}&tags=dinner')
+        _, queries = self.queries(
+            f'/api/recipes/?tags=dinner&author={self.author.pk}'
+        )
+        self.assertEqual(queries, 0)
+
+    def test_authenticated_requests_skip_cache(self):
+        self.queries('/api/recipes/')
+        response, queries = self.queries('/api/recipes/', self.author)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(queries, 0)
+
+    def test_error_responses_are_not_stored(self):
+        self.assertEqual(
+            self.queries('/api/recipes/0/')[0].status_code, 404
+        )
+        response, queries = self.queries('/api/recipes/0/')
+        self.assertEqual(response.status_code, 404)
+        self.assertGreater(queries, 0)
+
+    def test_writes_bump_generation(self):
+        changes = {
+            'recipe': lambda: self.recipe.save(),
+            'tag': lambda: self.tag.save(),
+            'ingredient': lambda: self.ingredient.save(),
+            'recipe tags': lambda: self.recipe.tags.add(self.tag),
+            'recipe ingredients': lambda: self.recipe.ingredients.add(
+                self.ingredient, through_defaults={'amount': 1}
+            ),
+            'author': lambda: self.author.save(),
+            'tag delete': lambda: self.tag.delete(),
+        }
+        for name, change in changes.items():
+            with self.subTest(name):
+                self.assertBumps(change)
+
+    def test_write_invalidates_cached_response(self):
+        self.queries('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+        response, queries = self.queries('/api/recipes/')
+        self.assertGreater(queries, 0)
+        self.assertEqual(
+            response.data['results'][0]['name'], 'Новое название'
+        )
+
+
+def database_error(pgcode):
+    cause = Exception('canceling statement due to statement timeout')
+    cause.pgcode = pgcode
+    error = OperationalError(*cause.args)
+    error.__cause__ = cause
+    return error
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StatementTimeoutTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = create_user('author')
+        create_recipe(self.author)
+
+    @contextmanager
+    def failing(self):
+        with mock.patch.object(
+            RecipeViewSet, 'filter_queryset',
+            side_effect=database_error(QUERY_CANCELED)
+        ), self.assertLogs('foods.timeouts', 'WARNING'):
+            yield
+
+    def test_timeout_returns_stale_response(self):
+        response = self.client.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save()
+        with self.failing():
+            stale = self.client.get('/api/recipes/')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale['Warning'], STALE_WARNING)
+        self.assertEqual(stale.content, response.content)
+
+    def test_timeout_without_stale_response_is_unavailable(self):
+        with self.failing():
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], str(RETRY_AFTER))
+
+    def test_authenticated_timeout_is_unavailable(self):
+        self.client.get('/api/recipes/')
+        client = APIClient()
+        client.force_authenticate(self.author)
+        with self.failing():
+            response = client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 503)
+
+    def test_other_errors_are_raised(self):
+        with mock.patch.object(
+            RecipeViewSet, 'filter_queryset',
+            side_effect=database_error('40001')
+        ), self.assertRaises(OperationalError):
+            self.client.get('/api/recipes/')
+
+
+class SparseFieldsTest(TestCase):
+
+    def setUp(self):
+        self.user = create_user('reader')
+        self.author = create_user('author')
+        self.tags = [
+            Tag.objects.create(name=name, slug=slug, color=color)
+            for name, slug, color in (
+                ('Завтрак', 'breakfast', '#00FF00'),
+                ('Ужин', 'dinner', '#0000FF'),
+            )
+        ]
+        self.recipes = [
+            create_recipe(self.author, name) for name in ('Борщ', 'Арбуз')
+        ]
+        for recipe in self.recipes:
+            recipe.tags.set(self.tags)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def recipe_queryset(self, query):
+        request = Request(APIRequestFactory().get('/api/recipes/', query))
+        request.user = self.user
+        view = RecipeViewSet(action='list', request=request, kwargs={})
+        return view.get_queryset()
+
+    def test_unknown_field_is_rejected(self):
+        for url in ('/api/recipes/?fields=id,calories',
+                    '/api/users/?fields=id,password'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('fields', response.data)
+
+    def test_recipe_output_is_trimmed(self):
+        response = self.client.get('/api/recipes/?fields=id,name')
+        self.assertEqual(response.status_code, 200)
+        for recipe in response.data['results']:
+            self.assertEqual(list(recipe), ['id', 'name'])
+
+    def test_recipe_columns_are_deferred(self):
+        recipe = self.recipe_queryset({'fields': 'id,name'}).first()
+        self.assertEqual(
+            recipe.get_deferred_fields(),
+            {field.attname for field in recipe._meta.concrete_fields}
+            - {'id', 'name'}
+        )
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, statements(queries)
+
+    @override_settings(RECIPE_READ_MODEL=False)
+    def test_prefetches_follow_fields(self):
+        # SET LOCAL statement_timeout, COUNT и сама страница.
+        _, queries = self.get('/api/recipes/?fields=id,name')
+        self.assertEqual(len(queries), 3)
+        response, queries = self.get('/api/recipes/?fields=id,tags')
+        self.assertEqual(len(queries), 4)
+        self.assertIn('recipes_tag', queries[-1])
+        self.assertEqual(
+            [tag['slug'] for tag in response.data['results'][0]['tags']],
+            ['breakfast', 'dinner']
+        )
+
+    def test_tags_filter_with_ordering_and_narrowed_columns(self):
+        response = self.client.get(
+            '/api/recipes/?tags=breakfast&tags=dinner&ordering=name'
+            '&fields=id,name'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['results']],
+            ['Арбуз', 'Борщ']
+        )
+
+    def test_user_output_is_trimmed(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/users/?fields=id,email')
+        self.assertEqual(response.status_code, 200)
+        for user in response.data['results']:
+            self.assertEqual(list(user), ['id', 'email'])
+
+
+class CartDigestTest(TestCase):
+
+    def setUp(self):
+        self.user = create_user('buyer')
+        self.author = create_user('author')
+        self.recipe = create_recipe(self.author)
+        self.other = create_recipe(self.author, 'Другой рецепт')
+        self.salt = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.salt, amount=5
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        self.digest = cart_digest(self.user)
+
+    def test_unrelated_writes_keep_digest(self):
+        self.other.save()
+        Tag.objects.create(name='Обед', slug='lunch')
+        self.author.save()
+        create_user('stranger').save()
+        self.assertEqual(cart_digest(self.user), self.digest)
+
+    def test_cart_recipe_edit_changes_digest(self):
+        self.recipe.save()
+        self.assertNotEqual(cart_digest(self.user), self.digest)
+
+    def test_cart_change_changes_digest(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.other)
+        self.assertNotEqual(cart_digest(self.user), self.digest)
+
+    def test_ingredient_rename_changes_digest(self):
+        self.salt.name = 'Соль морская'
+        self.salt.save()
+        self.assertNotEqual(cart_digest(self.user), self.digest)
+        self.assertEqual(
+            render_shopping_list(self.user), 'Соль морская (г) - 5'
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class EventTicketTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User(pk=7)
+
+    def test_ticket_is_accepted_once(self):
+        ticket = issue_ticket(self.user)
+        self.assertEqual(ticket_user(ticket), 7)
+        self.assertIsNone(ticket_user(ticket))
+
+    def test_tickets_are_unique(self):
+        self.assertNotEqual(issue_ticket(self.user), issue_ticket(self.user))
+
+    def test_forged_ticket_is_rejected(self):
+        self.assertIsNone(ticket_user(issue_ticket(self.user) + 'x'))
+
+    @override_settings(EVENTS_TICKET_AGE=-1)
+    def test_expired_ticket_is_rejected(self):
+        self.assertIsNone(ticket_user(issue_ticket(self.user)))
+
+
+class LocalBrokerTest(SimpleTestCase):
+
+    def test_events_reach_followers_of_the_author(self):
+        async def scenario():
+            broker = LocalBroker()
+            async with broker.listen({1}) as first, \
+                    broker.listen({2}) as second:
+                broker.publish({'id': 10, 'author': 1})
+                await asyncio.sleep(0)
+                broker.follow(second, {1})
+                broker.publish({'id': 11, 'author': 1})
+                broker.publish({'id': 12, 'author': 2})
+                await asyncio.sleep(0)
+                received = [
+                    [queue.get_nowait()['id'] for _ in range(queue.qsize())]
+                    for queue in (first, second)
+                ]
+            return received, broker.listeners, broker.authors
+
+        received, listeners, authors = asyncio.run(scenario())
+        self.assertEqual(received, [[10, 11], [11]])
+        self.assertEqual(listeners, {})
+        self.assertEqual(authors, {})
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHE, EVENTS_BACKEND='foods.events.LocalBroker'
+)
+class EventStreamTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+        self.user = create_user('reader')
+        self.author = create_user('author')
+        Subscription.objects.create(user=self.user, author=self.author)
+        self.token = Token.objects.create(user=self.user)
+
+    def authenticate(self, headers=None, query=''):
+        return asyncio.run(authenticate(headers or {}, query.encode()))
+
+    def test_authenticate_by_header_or_ticket(self):
+        self.assertEqual(self.authenticate(
+            {b'authorization': f'Token {self.token.key}'.encode()}
+        ), self.user.pk)
+        ticket = issue_ticket(self.user)
+        self.assertEqual(
+            self.authenticate(query=f'ticket={ticket}'), self.user.pk
+        )
+        self.assertIsNone(self.authenticate(query=f'ticket={ticket}'))
+
+    def test_token_in_query_is_rejected(self):
+        self.assertIsNone(self.authenticate(query=f'token={self.token.key}'))
+
+    def stream(self, query, publish=None):
+        messages = []
+
+        async def scenario():
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if len(messages) == 2 and publish:
+                    get_broker().publish(publish)
+                elif len(messages) > 2:
+                    disconnected.set()
+
+            await asyncio.wait_for(events(
+                {'type': 'http', 'path': '/api/events/', 'headers': [],
+                 'query_string': query.encode()},
+                receive, send
+            ), 5)
+
+        asyncio.run(scenario())
+        return messages
+
+    def test_recipe_of_followed_author_is_delivered(self):
+        messages = self.stream(
+            f'ticket={issue_ticket(self.user)}',
+            {'id': 1, 'name': 'Борщ', 'author': self.author.pk}
+        )
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn('event: recipe', messages[2]['body'].decode())
+        self.assertIn('Борщ', messages[2]['body'].decode())
+
+    def test_stream_without_credentials_is_unauthorized(self):
+        self.assertEqual(self.stream('')[0]['status'], 401)
+
+
+class ReadModelTest(TestCase):
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.tags = [
+            Tag.objects.create(name=name, slug=slug, color=color)
+            for name, slug, color in (
+                ('Ужин', 'dinner', '#0000FF'),
+                ('Завтрак', 'breakfast', '#00FF00'),
+            )
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Мука', 'Сахар')
+        ]
+        response = self.client.post('/api/recipes/', {
+            'name': 'Блины',
+            'text': 'Смешать и пожарить',
+            'cooking_time': 30,
+            'tags': [tag.id for tag in reversed(self.tags)],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in zip(
+                    reversed(self.ingredients), (100, 200, 5)
+                )
+            ],
+            'image': 'data:image/png;base64,'
+                     + base64.b64encode(png_bytes()).decode()
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.url = f'/api/recipes/{response.data["id"]}/'
+
+    def assertPathsMatch(self):
+        with override_settings(RECIPE_READ_MODEL=True):
+            rendered = self.client.get(self.url)
+        with override_settings(RECIPE_READ_MODEL=False):
+            related = self.client.get(self.url)
+        self.assertEqual(rendered.content, related.content)
+        return rendered.data
+
+    def test_read_model_matches_related_tables(self):
+        recipe = self.assertPathsMatch()
+        self.assertEqual(len(recipe['tags']), 2)
+        self.assertEqual(len(recipe['ingredients']), 3)
+
+    def test_tag_and_ingredient_edits_are_rebuilt(self):
+        self.tags[0].name = 'Поздний ужин'
+        self.tags[0].save()
+        self.ingredients[0].measurement_unit = 'щепоть'
+        self.ingredients[0].save()
+        recipe = self.assertPathsMatch()
+        self.assertIn('Поздний ужин', [tag['name'] for tag in recipe['tags']])
+        self.assertIn('щепоть', [
+            ingredient['measurement_unit']
+            for ingredient in recipe['ingredients']
+        ])
+
+    def test_tag_and_ingredient_deletes_are_rebuilt(self):
+        self.tags[0].delete()
+        self.ingredients[1].delete()
+        recipe = self.assertPathsMatch()
+        self.assertEqual(len(recipe['tags']), 1)
+        self.assertEqual(len(recipe['ingredients']), 2)
+
+    def test_unused_tag_delete(self):
+        Tag.objects.create(name='Обед', slug='lunch').delete()
+        Ingredient.objects.create(name='Перец', measurement_unit='г').delete()
+        self.assertPathsMatch()
+
+
+class AcceptsGzipTest(SimpleTestCase):
+
+    def test_q_values(self):
+        for header, expected in (
+            ('gzip, deflate, br', True),
+            ('br;q=1.0, gzip;q=0.5', True),
+            ('*', True),
+            ('', False),
+            ('identity', False),
+            ('gzip;q=0', False),
+            ('gzip; q=0.0, identity', False),
+            ('*;q=0.5, gzip;q=0', False),
+            ('GZIP', True),
+        ):
+            with self.subTest(header=header):
+                self.assertIs(accepts_gzip(header), expected)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class IngredientCatalogViewTest(TestCase):
+    url = '/api/ingredients/catalog/'
+
+    def setUp(self):
+        cache.clear()
+        self.salt = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def test_gzip_is_sent_only_when_accepted(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        catalog = json.loads(gzip.decompress(response.content))
+        self.assertEqual(catalog['ingredients'], [
+            {'id': self.salt.id, 'name': 'Соль', 'measurement_unit': 'г'}
+        ])
+        for header in ('gzip;q=0', 'identity'):
+            with self.subTest(header=header):
+                response = self.client.get(
+                    self.url, HTTP_ACCEPT_ENCODING=header
+                )
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(json.loads(response.content), catalog)
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.salt.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_delta_since_version(self):
+        version = json.loads(self.client.get(self.url).content)['version']
+        deleted = self.salt.id
+        self.salt.delete()
+        response = self.client.get(self.url, {'since': version})
+        self.assertEqual(response.data['changed'], [])
+        self.assertEqual(response.data['deleted'], [deleted])
+        response = self.client.get(self.url, {'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        self.user = create_user('staff')
+        self.user.is_staff = True
+        self.user.save()
+        self.user.user_permissions.add(
+            Permission.objects.get(codename='add_requestprofile')
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def get(self, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/api/tags/', HTTP_AUTHORIZATION=f'Token {self.token.key}',
+                **headers
+            )
+        token_lookups = [
+            query for query in statements(queries)
+            if 'authtoken_token' in query
+        ]
+        return response, token_lookups
+
+    def test_profiled_request_checks_token_once(self):
+        response, token_lookups = self.get(HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(token_lookups), 1)
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.user, self.user)
+        self.assertEqual(profile.path, '/api/tags/')
+
+    def test_request_without_header_is_not_profiled(self):
+        response, token_lookups = self.get()
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(len(token_lookups), 1)
+        self.assertFalse(RequestProfile.objects.exists())
@@ -0,0 +1,109 @@
+import logging
+import math
+import threading
+import time
+
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+CAS_ATTEMPTS = 5
+# Кэши без cas (LocMemCache) живут в памяти одного процесса, поэтому
+# чтение и запись корзины достаточно защитить локальной блокировкой.
+local_lock = threading.Lock()
+
+
+def gcra(arrival, now, interval, burst):
+    """Новое время корзины и 0 или None и ожидание в мс (GCRA)."""
+    arrival = max(arrival or now, now) + interval
+    if arrival - now > burst:
+        return None, arrival - now - burst
+    return arrival, 0
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket в общем кэше, единый для всех воркеров и узлов."""
+    cache_format = 'throttle_%(scope)s_%(ident)s'
+    rejected_format = 'throttle_rejected_%(scope)s'
+
+    def __init__(self):
+        # Частота определяется областью, а она известна только в
+        # allow_request.
+        pass
+
+    @staticmethod
+    def get_scope(view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        return scopes.get(
+            getattr(view, 'action', None),
+            getattr(view, 'throttle_scope', None)
+        )
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user_{request.user.pk}'
+        else:
+            ident = f'ip_{self.get_ident(request)}'
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def get_timeout(self, arrival, now):
+        """Корзина живёт, пока не наполнится, и ещё один период."""
+        return math.ceil(max(arrival - now, 0) / 1000) + self.duration
+
+    def take_token(self, interval, burst, now):
+        """Сдвигает время корзины; возвращает ожидание в мс, 0 — пропуск."""
+        client = getattr(self.cache, '_cache', None)
+        if not hasattr(client, 'gets'):
+            with local_lock:
+                arrival, wait = gcra(
+                    self.cache.get(self.key), now, interval, burst
+                )
+                if arrival is not None:
+                    self.cache.set(
+                        self.key, arrival, self.get_timeout(arrival, now)
+                    )
+                return wait
+        key = self.cache.make_key(self.key)
+        for _ in range(CAS_ATTEMPTS):
+            stored, token = client.gets(key)
+            arrival, wait = gcra(stored, now, interval, burst)
+            if arrival is None:
+                return wait
+            timeout = self.get_timeout(arrival, now)
+            if stored is None:
+                if client.add(key, arrival, expire=timeout, noreply=False):
+                    return 0
+            elif client.cas(key, arrival, token, expire=timeout):
+                return 0
+        # Корзину непрерывно меняют другие процессы: запрос считается
+        # лишним, повторить его можно через один интервал.
+        return interval
+
+    def allow_request(self, request, view):
+        self.scope = self.get_scope(view)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+
+        interval = self.duration * 1000 // self.num_requests
+        burst = interval * self.num_requests
+        wait = self.take_token(interval, burst, int(time.time() * 1000))
+        if not wait:
+            return True
+        self.wait_seconds = wait / 1000
+        return self.throttle_failure()
+
+    def throttle_failure(self):
+        rejected_key = self.rejected_format % {'scope': self.scope}
+        self.cache.add(rejected_key, 0, None)
+        try:
+            self.cache.incr(rejected_key)
+        except ValueError:
+            pass
+        logger.warning('Превышен лимит запросов %s: %s', self.scope, self.key)
+        return False
+
+    def wait(self):
+        return self.wait_seconds
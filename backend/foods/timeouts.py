@@ -0,0 +1,76 @@
+import logging
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .caching import stale_response
+
+logger = logging.getLogger(__name__)
+
+QUERY_CANCELED = '57014'
+RETRY_AFTER = 30
+
+
+class StatementTimeout:
+    """Выставляет statement_timeout транзакции перед первым запросом."""
+
+    def __init__(self, milliseconds):
+        self.milliseconds = milliseconds
+        self.applied = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.applied:
+            self.applied = True
+            context['cursor'].execute(
+                'SET LOCAL statement_timeout = %s', [self.milliseconds]
+            )
+        return execute(sql, params, many, context)
+
+
+def is_statement_timeout(error):
+    return getattr(error.__cause__, 'pgcode', None) == QUERY_CANCELED
+
+
+class StatementTimeoutMixin:
+    """Ограничивает время SQL-запросов по settings.STATEMENT_TIMEOUTS."""
+    statement_timeout_scopes = {}
+    statement_timeout_scope = None
+
+    def get_statement_timeout(self, request):
+        action = self.action_map.get(request.method.lower())
+        scope = self.statement_timeout_scopes.get(
+            action, self.statement_timeout_scope
+        )
+        return settings.STATEMENT_TIMEOUTS.get(scope)
+
+    def dispatch(self, request, *args, **kwargs):
+        timeout = self.get_statement_timeout(request)
+        if not timeout:
+            return super().dispatch(request, *args, **kwargs)
+        try:
+            with transaction.atomic(), connection.execute_wrapper(
+                StatementTimeout(timeout)
+            ):
+                return super().dispatch(request, *args, **kwargs)
+        except OperationalError as error:
+            if not is_statement_timeout(error):
+                raise
+        logger.warning(
+            'Превышено время запроса %s-%s (%s мс): %s %s',
+            self.basename,
+            self.action,
+            timeout,
+            kwargs,
+            dict(self.request.query_params.lists())
+        )
+        response = stale_response(self.request)
+        if response is None:
+            response = Response(
+                {'detail': 'Запрос выполнялся слишком долго. '
+                           'Попробуйте позже.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(RETRY_AFTER)}
+            )
+        return self.finalize_response(self.request, response, *args, **kwargs)
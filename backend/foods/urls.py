@@ -2,6 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (
+    ImageUploadViewSet,
     IngredientViewSet,
     RecipeViewSet,
     TagViewSet,
@@ -15,6 +16,7 @@ router.register(r'users', DefaultUserViewSet, basename='users')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
+router.register(r'uploads', ImageUploadViewSet, basename='uploads')
 
 urlpatterns = [
     path('', include(router.urls)),
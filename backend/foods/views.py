@@ -1,32 +1,48 @@
-from django.db.models import Sum, F
-from django.http import HttpResponse
+from django.conf import settings
+from django.db.models import BooleanField, Count, Exists, OuterRef, Value
+from django.http import (
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse
+)
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.serializers import SetPasswordSerializer
 from djoser.views import UserViewSet
 from rest_framework import (filters, status, mixins)
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.permissions import (AllowAny, IsAuthenticated)
+from rest_framework.permissions import (
+    AllowAny,
+    IsAdminUser,
+    IsAuthenticated
+)
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
+from .caching import cache_anonymous_response
+from .fieldsets import selected_fields
 from .filters import RecipeFilter, IngredientFilter
 from .serializers import (
-    FavoriteSerializer,
+    CookableRecipeSerializer,
+    ImageUploadSerializer,
     IngredientSerializer,
     RecipeListSerializer,
     RecipeCreateUpdateSerializer,
+    RecipeMinifiedSerializer,
     TagSerializer,
-    ShoppingCartSerializer,
-    SubscriptionSerializer,
     UserSubscriptionsSerializer,
     UserGetSerializer,
     UserPostSerializer
 )
+from recipes.catalog import catalog_delta, catalog_snapshot, current_version
+from recipes.export import ndjson, recipe_records, user_records
+from recipes.images import UploadConflict, append_upload, start_upload
+from recipes.ingredient_index import cookable_recipes
 from recipes.models import (
     Favorite,
+    ImageUpload,
     Ingredient,
-    RecipeIngredient,
     Recipe,
     Tag,
     ShoppingCart
@@ -34,6 +50,28 @@ from recipes.models import (
 from users.models import Subscription, User
 from .permissions import AuthorPermission
 from .pagination import DefaultPaginator
+from .relations import add_relation, remove_relation, target_pk
+from .shopping_list import shopping_list_response
+from .sse import issue_ticket
+from .timeouts import StatementTimeoutMixin
+
+COOK_LIMIT = 10
+COOK_MAX_LIMIT = 50
+CATALOG_CACHE_CONTROL = 'public, max-age=60'
+CATALOG_VERSIONED_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CATALOG_DELTA_CACHE_CONTROL = 'public, max-age=60'
+UPLOAD_CHUNK_SIZE = 64 * 1024
+NDJSON_CONTENT_TYPE = 'application/x-ndjson; charset=utf-8'
+USER_COLUMNS = ('id', 'email', 'username', 'first_name', 'last_name')
+RECIPE_READ_ACTIONS = ('list', 'retrieve', 'popular', 'similar')
+# Столбцы рецепта, которые нужны каждому полю RecipeListSerializer.
+RECIPE_COLUMNS = {
+    'name': ('name',),
+    'image': ('image',),
+    'text': ('text',),
+    'cooking_time': ('cooking_time',),
+    'author': tuple(f'author__{column}' for column in USER_COLUMNS),
+}
 
 
 class DefaultUserViewSet(UserViewSet):
@@ -45,6 +83,20 @@ class DefaultUserViewSet(UserViewSet):
     lookup_fields = ('name', 'id')
     http_method_names = ['get', 'post', 'delete']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        fields = selected_fields(self.request, UserGetSerializer().fields)
+        user = self.request.user
+        if 'is_subscribed' in fields and user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        return queryset.only(
+            'id', *(column for column in USER_COLUMNS if column in fields)
+        )
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return UserGetSerializer
@@ -66,40 +118,59 @@ class DefaultUserViewSet(UserViewSet):
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=kwargs['id'])
         user = request.user
         if request.method == 'POST':
-            serializer = SubscriptionSerializer(
+            if user.id == target_pk(User, kwargs['id']):
+                raise ValidationError(
+                    {'author': ['Нельзя подписаться на себя']}
+                )
+            author, created = add_relation(
+                Subscription, 'author', user, kwargs['id']
+            )
+            if not created:
+                raise ValidationError(
+                    {'non_field_errors': ['Вы уже подписаны']}
+                )
+            serializer = UserSubscriptionsSerializer(
+                author,
                 context={
-                    "request": request
-                },
-                data={
-                    'user': user.id,
-                    'author': author.id
+                    'request': request
                 }
             )
-            serializer.is_valid(raise_exception=True)
-            Subscription.objects.create(user=user, author=author)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        subscribe = Subscription.objects.filter(
-            user=user,
-            author=author
-        )
-        if not subscribe.exists():
+        if not remove_relation(Subscription, 'author', user, kwargs['id']):
             return Response(
                 {
                     'errors': 'Вы не подписаны на этого автора'
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
-        subscribe.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['post'],
+            permission_classes=[IsAuthenticated])
+    def events_ticket(self, request):
+        return Response(
+            {'ticket': issue_ticket(request.user)},
+            status=status.HTTP_201_CREATED
+        )
+
     @action(detail=False, methods=['get'],
             permission_classes=[AuthorPermission])
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
+        fields = selected_fields(
+            request, UserSubscriptionsSerializer().fields
+        )
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).only(
+            'id', *(column for column in USER_COLUMNS if column in fields)
+        )
+        if 'recipes_count' in fields:
+            queryset = queryset.annotate(recipes_count=Count('recipes'))
         page = self.paginate_queryset(queryset)
         serializer = UserSubscriptionsSerializer(
             page,
@@ -110,6 +181,30 @@ class DefaultUserViewSet(UserViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    @action(detail=True, methods=['get'],
+            permission_classes=[IsAdminUser])
+    def export(self, request, **kwargs):
+        user = get_object_or_404(User, id=target_pk(User, kwargs['id']))
+        return StreamingHttpResponse(
+            ndjson(user_records(user)), content_type=NDJSON_CONTENT_TYPE
+        )
+
+
+def accepts_gzip(accept_encoding):
+    """Разрешает ли Accept-Encoding gzip с учётом q (gzip;q=0 — нет)."""
+    weights = {}
+    for coding in accept_encoding.split(','):
+        name, *params = (part.strip() for part in coding.split(';'))
+        weight = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        weights[name.lower()] = weight
+    return weights.get('gzip', weights.get('*', 0)) > 0
+
 
 class IngredientViewSet(
     mixins.ListModelMixin,
@@ -123,6 +218,43 @@ class IngredientViewSet(
     filter_backends = (filters.SearchFilter,)
     filterset_class = IngredientFilter
     search_fields = ('^name',)
+    throttle_scopes = {'list': 'ingredient_list'}
+
+    @action(detail=False, methods=['get'])
+    def catalog(self, request):
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ValidationError(
+                    {'since': 'Параметр since должен быть целочисленным'}
+                )
+            response = Response(catalog_delta(since))
+            response['Cache-Control'] = CATALOG_DELTA_CACHE_CONTROL
+            return response
+
+        version = current_version()
+        etag = f'"ingredients-{version}"'
+        if request.query_params.get('version') == str(version):
+            cache_control = CATALOG_VERSIONED_CACHE_CONTROL
+        else:
+            cache_control = CATALOG_CACHE_CONTROL
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            body, compressed = catalog_snapshot(version)
+            if accepts_gzip(request.headers.get('Accept-Encoding', '')):
+                response = HttpResponse(
+                    compressed, content_type='application/json'
+                )
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        response['Vary'] = 'Accept-Encoding'
+        return response
 
 
 class TagViewSet(
@@ -136,105 +268,238 @@ class TagViewSet(
     pagination_class = None
 
 
-class RecipeViewSet(ModelViewSet):
+class ImageUploadViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    GenericViewSet
+):
+    """Загрузка картинки рецепта по частям с возможностью продолжить.
+
+    POST создаёт загрузку с именем файла и размером, PUT дописывает тело
+    запроса (файл или поле file в multipart) со смещения из заголовка
+    Upload-Offset, GET показывает, сколько байт уже получено. Токен
+    загрузки передаётся в поле image рецепта.
+    """
+    serializer_class = ImageUploadSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = None
+    lookup_field = 'token'
+    http_method_names = ['get', 'post', 'put', 'head']
+
+    def get_queryset(self):
+        return ImageUpload.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        start_upload(serializer.save(user=self.request.user))
+
+    def update(self, request, **kwargs):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers.get(
+                'Upload-Offset', request.query_params.get('offset', 0)
+            ))
+        except ValueError:
+            raise ValidationError('Смещение должно быть целочисленным')
+        if request.content_type.startswith('multipart/form-data'):
+            if 'file' not in request.FILES:
+                raise ValidationError({'file': 'Файл не передан'})
+            chunks = request.FILES['file'].chunks()
+        else:
+            chunks = iter(
+                lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b''
+            ) if request.stream else ()
+        try:
+            append_upload(upload, offset, chunks)
+        except UploadConflict:
+            upload.refresh_from_db()
+            return Response(
+                self.get_serializer(upload).data,
+                status=status.HTTP_409_CONFLICT
+            )
+        except ValueError as error:
+            raise ValidationError(str(error))
+        return Response(self.get_serializer(upload).data)
+
+
+class RecipeViewSet(StatementTimeoutMixin, ModelViewSet):
     queryset = Recipe.objects.all()
     pagination_class = DefaultPaginator
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     http_method_names = ["get", "post", "patch", "delete"]
+    throttle_scopes = {
+        'create': 'recipe_create',
+        'download_shopping_cart': 'shopping_cart_download',
+    }
+    statement_timeout_scopes = {
+        'list': 'recipe_list',
+        'popular': 'recipe_list',
+        'retrieve': 'recipe_detail',
+        'similar': 'recipe_detail',
+        'what_to_cook': 'what_to_cook',
+        'download_shopping_cart': 'shopping_cart_download',
+    }
 
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in RECIPE_READ_ACTIONS:
             return RecipeListSerializer
         return RecipeCreateUpdateSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in RECIPE_READ_ACTIONS:
+            queryset = self.sparse_queryset(queryset)
+        return queryset
+
+    def sparse_queryset(self, queryset):
+        """Читает только столбцы и связи полей из параметра fields."""
+        fields = selected_fields(self.request, RecipeListSerializer().fields)
+        columns = ['id']
+        for field in fields:
+            columns.extend(RECIPE_COLUMNS.get(field, ()))
+        if settings.RECIPE_READ_MODEL:
+            if fields & {'tags', 'ingredients'}:
+                columns.append('rendered')
+        else:
+            if 'tags' in fields:
+                queryset = queryset.prefetch_related('tags')
+            if 'ingredients' in fields:
+                queryset = queryset.prefetch_related('recipes__ingredient')
+        user = self.request.user
+        if 'author' in fields:
+            queryset = queryset.select_related('author')
+            if user.is_authenticated:
+                queryset = queryset.annotate(author_is_subscribed=Exists(
+                    Subscription.objects.filter(
+                        user=user, author=OuterRef('author_id')
+                    )
+                ))
+        if user.is_authenticated:
+            for field, model in (
+                ('is_favorited', Favorite),
+                ('is_in_shopping_cart', ShoppingCart),
+            ):
+                if field in fields:
+                    queryset = queryset.annotate(**{field: Exists(
+                        model.objects.filter(user=user, recipe=OuterRef('pk'))
+                    )})
+        return queryset.only(*columns)
+
+    @cache_anonymous_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_anonymous_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[AllowAny])
+    def popular(self, request):
+        if 'ordering' in request.query_params:
+            raise ValidationError(
+                {'ordering': 'Популярные рецепты сортируются по рейтингу'}
+            )
+        queryset = self.filter_queryset(
+            self.get_queryset().filter(popularity__isnull=False)
+        ).order_by('-popularity__score', '-pk')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'],
+            permission_classes=[AllowAny])
+    def similar(self, request, **kwargs):
+        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
+        queryset = self.get_queryset().filter(
+            similar_to__recipe=recipe
+        ).order_by('-similar_to__score')
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[AllowAny])
+    def what_to_cook(self, request):
+        try:
+            ingredients = {
+                int(ingredient)
+                for ingredient in request.query_params.getlist('ingredients')
+            }
+            limit = int(request.query_params.get('limit', COOK_LIMIT))
+        except ValueError:
+            raise ValidationError(
+                'Параметры ingredients и limit должны быть целочисленными'
+            )
+        if not ingredients:
+            raise ValidationError({'ingredients': 'Добавьте ингредиент'})
+        recipes = cookable_recipes(
+            ingredients, max(1, min(limit, COOK_MAX_LIMIT))
+        )
+        serializer = CookableRecipeSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAdminUser])
+    def export(self, request):
+        try:
+            after = int(request.query_params.get('after', 0))
+        except ValueError:
+            raise ValidationError('Параметр after должен быть целочисленным')
+        return StreamingHttpResponse(
+            ndjson(recipe_records(after)), content_type=NDJSON_CONTENT_TYPE
+        )
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
         user = request.user
         if request.method == 'POST':
-            serializer = FavoriteSerializer(
-                data={
-                    'user': user.id,
-                    'recipe': recipe.id
-                }
+            recipe, created = add_relation(
+                Favorite, 'recipe', user, kwargs['pk']
             )
-            serializer.is_valid(raise_exception=True)
-            Favorite.objects.create(user=user, recipe=recipe)
+            if not created:
+                raise ValidationError(
+                    {'non_field_errors': ['Рецепт уже в избранном']}
+                )
+            serializer = RecipeMinifiedSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        favorite = Favorite.objects.filter(user=user.id, recipe=recipe.id)
-        if not favorite.exists():
+        if not remove_relation(Favorite, 'recipe', user, kwargs['pk']):
             return Response(
                 {
                     'errors': 'Рецепта нет в избранном'
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
-        favorite.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['get'],
             permission_classes=[AuthorPermission])
     def download_shopping_cart(self, request):
-        items = RecipeIngredient.objects.select_related(
-            'recipe', 'ingredient'
-        )
-        items = items.filter(recipe__shopping_carts__user=request.user).all()
-        shopping_cart = items.values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            name=F('ingredient__name'),
-            units=F('ingredient__measurement_unit'),
-            total=Sum('amount')
-        ).order_by('-total')
-        text = '\n'.join(
-            [f"{item.get('name')} ({item.get('units')}) - {item.get('total')}"
-             for item in shopping_cart]
-        )
-        filename = 'foodgram_shopping_cart.txt'
-        response = HttpResponse(text, content_type='text/plan')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
-        return response
+        return shopping_list_response(request.user)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
         user = request.user
         if request.method == 'POST':
-            serializer = ShoppingCartSerializer(
-                context={
-                    "request": request
-                },
-                data={
-                    'user': user.id,
-                    'recipe': recipe.id
-                }
-            )
-            serializer.is_valid(raise_exception=True)
-            _, created = ShoppingCart.objects.get_or_create(
-                user=user,
-                recipe=recipe
+            recipe, created = add_relation(
+                ShoppingCart, 'recipe', user, kwargs['pk']
             )
             if not created:
-                return Response(
-                    {'detail': 'Рецепт уже добавлен в список покупок'},
-                    status=status.HTTP_400_BAD_REQUEST
+                raise ValidationError(
+                    {'recipe': ['Рецепт уже есть в корзине']}
                 )
+            serializer = RecipeMinifiedSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
-        shopping_cart = ShoppingCart.objects.filter(
-            recipe=recipe.id,
-            user=user.id
-        )
-        if not shopping_cart.exists():
+        if not remove_relation(ShoppingCart, 'recipe', user, kwargs['pk']):
             return Response(
                 {
                     'errors': 'Этого рецепта нет в списке покупок'
                 },
                 status=status.HTTP_400_BAD_REQUEST
             )
-        shopping_cart.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,26 +1,37 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
 
 from recipes.models import (
     Favorite,
     RecipeIngredient,
     Ingredient,
     Recipe,
+    RequestProfile,
     Tag,
     ShoppingCart
 )
+from recipes.read_model import rebuild_read_model
 
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'measurement_unit')
-    list_filter = ('name',)
     search_fields = ('^name',)
 
 
 class IngredientInline(admin.TabularInline):
     model = RecipeIngredient
-    list_display = ('id', 'recipe', 'ingredient', 'amount')
-    list_editable = ('recipe', 'ingredient', 'amount')
+    autocomplete_fields = ('ingredient',)
+    extra = 1
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient'
+        )
 
 
 @admin.register(Tag)
@@ -36,30 +47,114 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = ('id',
                     'name',
                     'author',
-                    'text',
                     'image',
                     'favorite_count',
                     'cooking_time')
     readonly_fields = ('favorite_count',)
-    list_filter = ('name', 'author', 'tags')
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    search_fields = ('^name', '^author__username')
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        rebuild_read_model(Recipe.objects.filter(pk=form.instance.pk))
 
     @staticmethod
     def tags(recipe):
         tag_names = list(recipe.tags.values_list('name', flat=True))
         return ' '.join(tag_names)
 
-    @admin.display(description='В избранном')
+    @admin.display(description='В избранном', ordering='favorites_count')
     def favorite_count(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
-    list_editable = ('user', 'recipe')
+    list_select_related = ('user', 'recipe__author')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
-    list_editable = ('user', 'recipe')
+    list_select_related = ('user', 'recipe__author')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created',
+                    'method',
+                    'path',
+                    'status_code',
+                    'duration',
+                    'query_count',
+                    'query_duration',
+                    'user')
+    list_filter = ('method', 'status_code')
+    list_select_related = ('user',)
+    search_fields = ('path',)
+    fields = ('user',
+              'method',
+              'path',
+              'status_code',
+              'duration',
+              'query_count',
+              'query_duration',
+              'samples',
+              'created',
+              'flamegraph',
+              'query_list')
+    readonly_fields = ('flamegraph', 'query_list')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/flamegraph/',
+                self.admin_site.admin_view(self.flamegraph_view),
+                name='recipes_requestprofile_flamegraph'
+            ),
+        ] + super().get_urls()
+
+    def flamegraph_view(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        response = HttpResponse(
+            profile.stacks, content_type='text/plain; charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=profile-{pk}.folded'
+        )
+        return response
+
+    @admin.display(description='Flamegraph')
+    def flamegraph(self, obj):
+        return format_html(
+            '<a href="{}">profile-{}.folded</a>',
+            reverse('admin:recipes_requestprofile_flamegraph', args=[obj.pk]),
+            obj.pk
+        )
+
+    @admin.display(description='SQL-запросы')
+    def query_list(self, obj):
+        return format_html(
+            '<ol>{}</ol>',
+            format_html_join(
+                '',
+                '<li>{} мс: <code>{}</code></li>',
+                ((query['duration'], query['sql']) for query in obj.queries)
+            )
+        )
@@ -0,0 +1,51 @@
+import gzip
+import json
+
+from django.core.cache import cache
+from django.db.models import Max
+
+from recipes.models import Ingredient, IngredientChange
+
+FIELDS = ('id', 'name', 'measurement_unit')
+
+
+def current_version():
+    return IngredientChange.objects.aggregate(
+        version=Max('id')
+    )['version'] or 0
+
+
+def catalog_snapshot(version):
+    """JSON каталога и его gzip-версия, собираются раз на версию."""
+    key = f'ingredient_catalog_{version}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        body = json.dumps(
+            {
+                'version': version,
+                'ingredients': list(Ingredient.objects.values(*FIELDS))
+            },
+            ensure_ascii=False,
+            separators=(',', ':')
+        ).encode()
+        snapshot = body, gzip.compress(body, compresslevel=9)
+        cache.set(key, snapshot, None)
+    return snapshot
+
+
+def catalog_delta(since):
+    """Ингредиенты, добавленные, изменённые и удалённые после версии."""
+    version = current_version()
+    changed = set(IngredientChange.objects.filter(
+        id__gt=since
+    ).values_list('ingredient_id', flat=True))
+    ingredients = list(
+        Ingredient.objects.filter(id__in=changed).values(*FIELDS)
+    )
+    return {
+        'version': version,
+        'changed': ingredients,
+        'deleted': sorted(
+            changed - {ingredient['id'] for ingredient in ingredients}
+        )
+    }
@@ -0,0 +1,95 @@
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, prefetch_related_objects
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.read_model import (
+    INGREDIENT_FIELDS,
+    TAG_FIELDS,
+    read_model_items
+)
+from users.models import Subscription
+
+CHUNK_SIZE = 2000
+
+
+def ndjson(records):
+    for record in records:
+        yield json.dumps(
+            record, ensure_ascii=False, cls=DjangoJSONEncoder
+        ) + '\n'
+
+
+def recipe_record(recipe):
+    if recipe.rendered is not None:
+        tags = read_model_items(recipe.rendered['tags'], TAG_FIELDS)
+        ingredients = read_model_items(
+            recipe.rendered['ingredients'], INGREDIENT_FIELDS
+        )
+    else:
+        tags = [
+            {field: getattr(tag, field) for field in TAG_FIELDS}
+            for tag in recipe.tags.all()
+        ]
+        ingredients = [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount
+            }
+            for item in recipe.recipes.all()
+        ]
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'author': {
+            'id': recipe.author.id,
+            'username': recipe.author.username
+        },
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'pub_date': recipe.pub_date,
+        'updated': recipe.updated,
+        'tags': tags,
+        'ingredients': ingredients
+    }
+
+
+def recipe_records(after=0, chunk_size=CHUNK_SIZE):
+    """Рецепты с id больше after по возрастанию id, пачками."""
+    recipes = Recipe.objects.filter(pk__gt=after).select_related(
+        'author'
+    ).order_by('pk').iterator(chunk_size)
+    while True:
+        batch = list(islice(recipes, chunk_size))
+        if not batch:
+            return
+        prefetch_related_objects(
+            [recipe for recipe in batch if recipe.rendered is None],
+            'tags',
+            'recipes__ingredient'
+        )
+        for recipe in batch:
+            yield recipe_record(recipe)
+
+
+def user_records(user, chunk_size=CHUNK_SIZE):
+    """Избранное, корзина и подписки пользователя."""
+    sections = (
+        ('favorite', Favorite.objects.filter(user=user).values(
+            'id', 'recipe_id', 'added', recipe_name=F('recipe__name')
+        )),
+        ('shopping_cart', ShoppingCart.objects.filter(user=user).values(
+            'id', 'recipe_id', 'added', recipe_name=F('recipe__name')
+        )),
+        ('subscription', Subscription.objects.filter(user=user).values(
+            'id', 'author_id', author_username=F('author__username')
+        )),
+    )
+    for kind, queryset in sections:
+        for row in queryset.order_by('pk').iterator(chunk_size):
+            yield {'type': kind, **row}
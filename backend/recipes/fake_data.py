@@ -0,0 +1,228 @@
+import csv
+import io
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag
+)
+from recipes.read_model import rebuild_read_model
+from users.models import Subscription, User
+
+PLACEHOLDER_IMAGES = 8
+PLACEHOLDER_PATH = 'recipes/media/placeholder_{}.png'
+PERIOD = timedelta(days=730)
+
+
+def power_law(rng, size, count, exponent=1.1):
+    """Индексы 0..size-1 с вероятностью, убывающей как 1 / rank^exponent."""
+    weights = 1 / np.arange(1, size + 1) ** exponent
+    return rng.choice(size, count, p=weights / weights.sum())
+
+
+def copy_value(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, list):
+        return '{' + ','.join(map(str, value)) + '}'
+    return value
+
+
+def unique_pairs(left, right, width):
+    keys = np.unique(left.astype(np.int64) * width + right)
+    return keys // width, keys % width
+
+
+class FakeDataGenerator:
+    """Быстро заполняет базу правдоподобными данными для нагрузочных тестов.
+
+    Распределения скошены: немногие авторы пишут большую часть рецептов,
+    немногие рецепты собирают большую часть избранного, а популярные
+    ингредиенты встречаются почти везде. В PostgreSQL строки пишутся
+    через COPY, в остальных базах — пачками bulk_create.
+    """
+
+    def __init__(self, seed=0, batch_size=100000, report=None):
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        self.report = report or (lambda message: None)
+        self.now = timezone.now()
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def write(self, model, fields, columns):
+        """Записывает столбцы numpy или списки значений в таблицу."""
+        started = time.monotonic()
+        total = len(columns[0])
+        defaults = {
+            field.attname: field.get_default()
+            for field in model._meta.concrete_fields
+            if field.attname not in fields and not field.primary_key
+            and not field.null
+        }
+        names = [*fields, *defaults]
+        for start in range(0, total, self.batch_size):
+            rows = zip(
+                *(column[start:start + self.batch_size] for column in columns),
+                *([value] * min(self.batch_size, total - start)
+                  for value in defaults.values())
+            )
+            if connection.vendor == 'postgresql':
+                self.copy(model, names, rows)
+            else:
+                model.objects.bulk_create(
+                    (model(**dict(zip(names, row))) for row in rows),
+                    batch_size=1000
+                )
+        if 'id' in fields:
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                        no_style(), [model]):
+                    cursor.execute(sql)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.report(
+            f'{model._meta.db_table}: {total} строк за {elapsed:.1f} с '
+            f'({total / elapsed:.0f} строк/с)'
+        )
+        return total
+
+    @staticmethod
+    def copy(model, names, rows):
+        buffer = io.StringIO()
+        # Пустые строки в кавычках, иначе COPY прочитает их как NULL.
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+        for row in rows:
+            writer.writerow(copy_value(value) for value in row)
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {quote(model._meta.db_table)} '
+                f'({", ".join(quote(name) for name in names)}) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+
+    def dates(self, count):
+        offsets = self.rng.random(count) * PERIOD.total_seconds()
+        return [self.now - timedelta(seconds=offset) for offset in offsets]
+
+    def placeholder_images(self):
+        from PIL import Image
+
+        paths = []
+        for index in range(PLACEHOLDER_IMAGES):
+            path = PLACEHOLDER_PATH.format(index)
+            if not default_storage.exists(path):
+                buffer = io.BytesIO()
+                color = tuple(int(c) for c in self.rng.integers(0, 256, 3))
+                Image.new('RGB', (64, 64), color).save(buffer, 'PNG')
+                default_storage.save(path, ContentFile(buffer.getvalue()))
+            paths.append(path)
+        return paths
+
+    def generate(self, users, recipes, favorites, carts, subscriptions):
+        rng = self.rng
+        ingredients = np.array(
+            list(Ingredient.objects.values_list('id', flat=True))
+        )
+        tags = np.array(list(Tag.objects.values_list('id', flat=True)))
+        rng.shuffle(ingredients)
+        started = time.monotonic()
+        total = 0
+
+        first_user = self.next_id(User)
+        user_ids = np.arange(first_user, first_user + users)
+        total += self.write(User, ('id', 'username', 'email', 'password'), (
+            user_ids,
+            [f'fake_user_{i}' for i in user_ids],
+            [f'fake_user_{i}@example.com' for i in user_ids],
+            ['!'] * users,
+        ))
+
+        first_recipe = self.next_id(Recipe)
+        recipe_ids = np.arange(first_recipe, first_recipe + recipes)
+        pub_dates = self.dates(recipes)
+        images = self.placeholder_images()
+        total += self.write(Recipe, (
+            'id', 'name', 'author_id', 'image', 'text', 'cooking_time',
+            'pub_date', 'updated'
+        ), (
+            recipe_ids,
+            [f'Рецепт {i}' for i in recipe_ids],
+            user_ids[power_law(rng, users, recipes)],
+            [images[i] for i in rng.integers(0, len(images), recipes)],
+            ['Описание приготовления.'] * recipes,
+            np.clip(rng.lognormal(3.2, 0.6, recipes), 1, 200).astype(int),
+            pub_dates,
+            pub_dates,
+        ))
+
+        per_recipe = rng.integers(3, 13, recipes)
+        recipe_rows, ingredient_rows = unique_pairs(
+            np.repeat(np.arange(recipes), per_recipe),
+            power_law(rng, len(ingredients), per_recipe.sum(), 0.8),
+            len(ingredients)
+        )
+        total += self.write(
+            RecipeIngredient, ('recipe_id', 'ingredient_id', 'amount'), (
+                recipe_ids[recipe_rows],
+                ingredients[ingredient_rows],
+                rng.integers(1, 500, len(recipe_rows)),
+            )
+        )
+
+        through = Recipe.tags.through
+        recipe_rows, tag_rows = unique_pairs(
+            rng.integers(0, recipes, recipes * 2),
+            rng.integers(0, len(tags), recipes * 2),
+            len(tags)
+        )
+        total += self.write(through, ('recipe_id', 'tag_id'), (
+            recipe_ids[recipe_rows], tags[tag_rows]
+        ))
+
+        for model, count in ((Favorite, favorites), (ShoppingCart, carts)):
+            user_rows, recipe_rows = unique_pairs(
+                power_law(rng, users, count, 0.7),
+                power_law(rng, recipes, count),
+                recipes
+            )
+            total += self.write(model, ('user_id', 'recipe_id', 'added'), (
+                user_ids[user_rows],
+                recipe_ids[recipe_rows],
+                self.dates(len(user_rows)),
+            ))
+
+        user_rows, author_rows = unique_pairs(
+            rng.integers(0, users, subscriptions),
+            power_law(rng, users, subscriptions),
+            users
+        )
+        other = user_rows != author_rows
+        total += self.write(Subscription, ('user_id', 'author_id'), (
+            user_ids[user_rows[other]], user_ids[author_rows[other]]
+        ))
+
+        rebuild_read_model(Recipe.objects.filter(pk__gte=first_recipe))
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.report(
+            f'Всего: {total} строк за {elapsed:.1f} с '
+            f'({total / elapsed:.0f} строк/с)'
+        )
+        return total
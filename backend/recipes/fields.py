@@ -0,0 +1,21 @@
+from colorfield.validators import color_hex_validator
+from django.db import models
+
+
+class ColorField(models.CharField):
+    """HEX-цвет с виджетом colorfield.
+
+    colorfield.fields при импорте загружает Pillow ради выбора цвета по
+    картинке, поэтому виджет подключается только при построении формы.
+    """
+    default_validators = [color_hex_validator]
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 7)
+        super().__init__(*args, **kwargs)
+
+    def formfield(self, **kwargs):
+        from colorfield.widgets import ColorWidget
+
+        kwargs['widget'] = ColorWidget
+        return super().formfield(**kwargs)
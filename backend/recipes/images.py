@@ -0,0 +1,141 @@
+import base64
+import binascii
+import fcntl
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.models import ImageUpload, Recipe, RecipeImage
+
+# Кратно 4, чтобы каждый кусок base64 декодировался отдельно.
+DECODE_CHUNK = 4 * 64 * 1024
+
+
+def decode_data_uri(data):
+    """Декодирует data:...;base64 во временный файл, возвращает и sha256."""
+    header, _, encoded = data.partition(';base64,')
+    content_type = header[len('data:'):]
+    upload = TemporaryUploadedFile(
+        f'upload.{content_type.split("/")[-1]}', content_type, 0, None
+    )
+    digest = hashlib.sha256()
+    try:
+        for start in range(0, len(encoded), DECODE_CHUNK):
+            chunk = base64.b64decode(
+                encoded[start:start + DECODE_CHUNK], validate=True
+            )
+            digest.update(chunk)
+            upload.write(chunk)
+    except binascii.Error:
+        upload.close()
+        raise ValueError('Некорректные данные base64')
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload, digest.hexdigest()
+
+
+def file_digest(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def image_name(digest, extension):
+    directory = Recipe._meta.get_field('image').upload_to
+    return os.path.join(directory, digest[:2], f'{digest}.{extension}')
+
+
+def store_image(file, digest, extension):
+    """Сохраняет картинку под именем из хэша, если её ещё нет."""
+    name = image_name(digest, extension)
+    # Блокировка строки не даёт clear_orphaned_images удалить файл,
+    # который только что выдали снова.
+    with transaction.atomic():
+        image, _ = RecipeImage.objects.select_for_update().get_or_create(
+            name=name
+        )
+        if not default_storage.exists(name):
+            name = default_storage.save(name, file)
+            if name != image.name:
+                image, _ = RecipeImage.objects.get_or_create(name=name)
+        image.updated = timezone.now()
+        image.save(update_fields=('updated',))
+    return name
+
+
+def retain_image(name):
+    if not name:
+        return
+    updated = RecipeImage.objects.filter(name=name).update(
+        references=F('references') + 1, updated=timezone.now()
+    )
+    if not updated:
+        RecipeImage.objects.get_or_create(
+            name=name, defaults={'references': 1}
+        )
+
+
+def release_image(name):
+    if name:
+        RecipeImage.objects.filter(name=name, references__gt=0).update(
+            references=F('references') - 1, updated=timezone.now()
+        )
+
+
+class UploadConflict(Exception):
+    """Часть загрузки пришла не с того смещения, на котором она стоит."""
+
+
+def upload_path(upload):
+    return os.path.join(settings.IMAGE_UPLOAD_ROOT, f'{upload.token}.part')
+
+
+def start_upload(upload):
+    os.makedirs(settings.IMAGE_UPLOAD_ROOT, exist_ok=True)
+    open(upload_path(upload), 'wb').close()
+
+
+def append_upload(upload, offset, chunks):
+    """Дописывает части в файл загрузки начиная с offset."""
+    with open(upload_path(upload), 'r+b') as file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadConflict
+        received = ImageUpload.objects.filter(pk=upload.pk).values_list(
+            'received', flat=True
+        ).first()
+        if offset != received:
+            raise UploadConflict
+        written = 0
+        file.seek(offset)
+        try:
+            for chunk in chunks:
+                if offset + written + len(chunk) > upload.size:
+                    raise ValueError('Загрузка больше заявленного размера')
+                file.write(chunk)
+                written += len(chunk)
+        finally:
+            # Принятое учитывается и при обрыве соединения.
+            file.truncate()
+            if written:
+                ImageUpload.objects.filter(pk=upload.pk).update(
+                    received=offset + written
+                )
+            upload.received = offset + written
+
+
+def finish_upload(upload):
+    try:
+        os.remove(upload_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
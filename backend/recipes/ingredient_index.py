@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db import connection
+from django.utils import timezone
+
+from recipes.models import Recipe, RecipeIngredient
+
+SYNC_INTERVAL = 5
+SYNC_OVERLAP = timedelta(seconds=30)
+REBUILD_RATIO = 0.1
+# Полная перестройка читает всю RecipeIngredient и не должна упираться в
+# statement_timeout запроса what_to_cook, мс.
+REBUILD_TIMEOUT = 120000
+
+
+class IngredientIndex:
+    """Инвертированный индекс ингредиент -> рецепты в памяти процесса."""
+
+    def __init__(self):
+        # Запросы к базе идут под _sync_lock, а не под _lock.
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced = None
+        self._checked = None
+
+    @staticmethod
+    def _load(pairs):
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        return recipe_ids, rows.reshape(-1), pairs[:, 1]
+
+    @staticmethod
+    def _read_all():
+        if not connection.in_atomic_block:
+            return list(RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id'
+            ))
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            previous = cursor.fetchone()[0]
+            cursor.execute(
+                'SET LOCAL statement_timeout = %s', [REBUILD_TIMEOUT]
+            )
+            try:
+                return list(RecipeIngredient.objects.values_list(
+                    'recipe_id', 'ingredient_id'
+                ))
+            finally:
+                cursor.execute(
+                    'SET LOCAL statement_timeout = %s', [previous]
+                )
+
+    def _build(self, pairs):
+        recipe_ids, rows, ingredients = self._load(pairs)
+        order = np.argsort(ingredients, kind='stable')
+        keys, starts = np.unique(ingredients[order], return_index=True)
+        return {
+            '_postings': dict(zip(
+                keys.tolist(), np.split(rows[order], starts[1:])
+            )),
+            '_recipe_ids': recipe_ids,
+            '_totals': np.bincount(rows, minlength=len(recipe_ids)),
+            '_alive': np.ones(len(recipe_ids), dtype=bool),
+            '_rows': dict(zip(recipe_ids.tolist(), range(len(recipe_ids)))),
+            '_dead': 0,
+        }
+
+    def _rebuild(self):
+        state = self._build(self._read_all())
+        with self._lock:
+            self.__dict__.update(state)
+        self._seen = {}
+
+    def _discard(self, recipe_ids):
+        for recipe_id in recipe_ids:
+            row = self._rows.pop(recipe_id, None)
+            if row is not None:
+                self._alive[row] = False
+                self._dead += 1
+
+    def _apply(self, recipe_ids, pairs):
+        new_ids, rows, ingredients = self._load(pairs)
+        self._discard(recipe_ids)
+        offset = len(self._recipe_ids)
+        rows = rows + offset
+        for ingredient, row in zip(ingredients.tolist(), rows.tolist()):
+            posting = self._postings.get(ingredient)
+            self._postings[ingredient] = (
+                np.array([row]) if posting is None
+                else np.append(posting, row)
+            )
+        self._recipe_ids = np.concatenate((self._recipe_ids, new_ids))
+        self._totals = np.concatenate((
+            self._totals, np.bincount(rows - offset, minlength=len(new_ids))
+        ))
+        self._alive = np.concatenate((
+            self._alive, np.ones(len(new_ids), dtype=bool)
+        ))
+        self._rows.update(zip(new_ids.tolist(), range(offset, offset + len(
+            new_ids))))
+
+    def _fresh(self):
+        return (self._checked is not None
+                and time.monotonic() - self._checked < SYNC_INTERVAL)
+
+    def _sync(self):
+        if self._fresh():
+            return
+        # Пока индекса нет, ждать приходится всем; потом синхронизирует
+        # один поток, остальные ищут по текущей версии.
+        if not self._sync_lock.acquire(blocking=self._synced is None):
+            return
+        try:
+            if self._fresh():
+                return
+            if self._synced is None:
+                now = timezone.now()
+                self._rebuild()
+            else:
+                now = self._update()
+            self._synced = now
+            self._checked = time.monotonic()
+        finally:
+            self._sync_lock.release()
+
+    def _update(self):
+        now = timezone.now()
+        changed = {
+            recipe_id: updated for recipe_id, updated
+            in Recipe.objects.filter(
+                updated__gte=self._synced - SYNC_OVERLAP
+            ).values_list('id', 'updated')
+            if self._seen.get(recipe_id) != updated
+        }
+        if changed:
+            pairs = list(RecipeIngredient.objects.filter(
+                recipe_id__in=list(changed)
+            ).values_list('recipe_id', 'ingredient_id'))
+            with self._lock:
+                self._apply(list(changed), pairs)
+            self._seen.update(changed)
+        self._seen = {
+            recipe_id: updated for recipe_id, updated
+            in self._seen.items() if updated >= now - SYNC_OVERLAP
+        }
+        if self._dead > REBUILD_RATIO * len(self._recipe_ids):
+            self._rebuild()
+        return now
+
+    def warm(self):
+        """Строит индекс заранее, вне запросов и их statement_timeout."""
+        self._sync()
+
+    def discard(self, recipe_ids):
+        with self._lock:
+            self._discard(recipe_ids)
+
+    def search(self, ingredient_ids, limit):
+        """Пары (id рецепта, число имеющихся ингредиентов), лучшие первыми."""
+        self._sync()
+        with self._lock:
+            covered = np.zeros(len(self._recipe_ids), dtype=np.int64)
+            for ingredient in ingredient_ids:
+                rows = self._postings.get(ingredient)
+                if rows is not None:
+                    covered[rows] += 1
+            covered[~self._alive] = 0
+            candidates = np.flatnonzero(covered)
+            missing = self._totals[candidates] - covered[candidates]
+            # Сначала меньше недостающих, затем больше имеющихся.
+            order = np.lexsort((-covered[candidates], missing))[:limit]
+            return list(zip(
+                self._recipe_ids[candidates[order]].tolist(),
+                covered[candidates[order]].tolist()
+            ))
+
+
+ingredient_index = IngredientIndex()
+
+
+def cookable_recipes(ingredient_ids, limit):
+    """Лучшие рецепты из имеющихся ингредиентов со списком недостающих."""
+    while True:
+        found = ingredient_index.search(ingredient_ids, limit)
+        recipes = Recipe.objects.in_bulk([recipe_id for recipe_id, _ in found])
+        deleted = [
+            recipe_id for recipe_id, _ in found if recipe_id not in recipes
+        ]
+        if not deleted:
+            break
+        ingredient_index.discard(deleted)
+
+    missing = defaultdict(list)
+    items = RecipeIngredient.objects.filter(
+        recipe_id__in=list(recipes)
+    ).exclude(
+        ingredient_id__in=ingredient_ids
+    ).select_related('ingredient')
+    for item in items:
+        missing[item.recipe_id].append(item)
+
+    result = []
+    for recipe_id, covered in found:
+        recipe = recipes[recipe_id]
+        recipe.covered = covered
+        recipe.missing = missing[recipe_id]
+        result.append(recipe)
+    return result
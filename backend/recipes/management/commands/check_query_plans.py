@@ -0,0 +1,189 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from recipes.fake_data import FakeDataGenerator
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag
+)
+from users.models import Subscription, User
+
+PAGE_SIZE = 6
+DEEP_PAGE = 50
+GUARDED_TABLES = {
+    Recipe._meta.db_table,
+    Recipe.tags.through._meta.db_table,
+    RecipeIngredient._meta.db_table,
+    Favorite._meta.db_table,
+    ShoppingCart._meta.db_table,
+    Subscription._meta.db_table,
+    User._meta.db_table,
+}
+
+
+def generate_dataset(users, recipes, seed):
+    """Заполняет базу случайными данными для проверки планов."""
+    if not Ingredient.objects.exists():
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ingredient {i}', measurement_unit='г')
+            for i in range(1000)
+        )
+    if not Tag.objects.exists():
+        Tag.objects.bulk_create(
+            Tag(name=f'tag {i}', slug=f'tag-{i}', color=f'#0000{i:02}')
+            for i in range(3)
+        )
+    FakeDataGenerator(seed=seed).generate(
+        users=users,
+        recipes=recipes,
+        favorites=recipes * 3,
+        carts=recipes,
+        subscriptions=users * 10
+    )
+
+
+def typical(model, field):
+    """Значение из середины, а не из «горячей» головы распределения."""
+    values = model.objects.values_list(field, flat=True).distinct()
+    return values.order_by(field)[values.count() // 2]
+
+
+def representative_queries():
+    """Запросы, которые выполняют эндпоинты API, и бюджеты их стоимости."""
+    user = typical(ShoppingCart, 'user_id')
+    author = typical(Subscription, 'author_id')
+    recipe = typical(Favorite, 'recipe_id')
+    ingredient = typical(RecipeIngredient, 'ingredient_id')
+    tag = Tag.objects.values_list('slug', flat=True).first()
+    return (
+        ('recipes-list', 100,
+         Recipe.objects.all()[:PAGE_SIZE]),
+        ('recipes-list-author', 100,
+         Recipe.objects.filter(author_id=author)[:PAGE_SIZE]),
+        ('recipes-list-tags', 500,
+         Recipe.objects.filter(tags__slug=tag).distinct()[:PAGE_SIZE]),
+        ('recipes-list-ingredients', 2000,
+         Recipe.objects.filter(
+             ingredient_ids__contains=[ingredient]
+         )[:PAGE_SIZE]),
+        ('recipes-list-cooking-time', 500,
+         Recipe.objects.filter(
+             cooking_time__gte=10, cooking_time__lte=30
+         ).order_by('cooking_time', '-pub_date')[:PAGE_SIZE]),
+        ('recipes-list-by-name-deep', 500,
+         Recipe.objects.order_by(
+             'name', '-pub_date'
+         )[DEEP_PAGE * PAGE_SIZE:(DEEP_PAGE + 1) * PAGE_SIZE]),
+        ('recipes-list-by-favorites-deep', 500,
+         Recipe.objects.order_by(
+             '-favorites_count', '-pub_date'
+         )[DEEP_PAGE * PAGE_SIZE:(DEEP_PAGE + 1) * PAGE_SIZE]),
+        ('recipes-is-favorited', 50,
+         Favorite.objects.filter(user_id=user, recipe_id=recipe)),
+        ('recipes-favorites-by-recipe', 100,
+         Favorite.objects.filter(recipe_id=recipe).values('user_id')),
+        ('recipes-shopping-cart-by-recipe', 100,
+         ShoppingCart.objects.filter(recipe_id=recipe).values('user_id')),
+        ('recipes-download-shopping-cart', 1000,
+         RecipeIngredient.objects.filter(
+             recipe__shopping_carts__user_id=user
+         ).values(
+             'ingredient__name', 'ingredient__measurement_unit'
+         ).annotate(
+             name=F('ingredient__name'),
+             units=F('ingredient__measurement_unit'),
+             total=Sum('amount')
+         ).order_by('-total')),
+        ('users-subscriptions', 500,
+         User.objects.filter(following__user_id=user)[:PAGE_SIZE]),
+        ('users-subscribers', 100,
+         Subscription.objects.filter(author_id=author).values('user_id')),
+        ('ingredients-recipes', 2000,
+         RecipeIngredient.objects.filter(
+             ingredient_id=ingredient
+         ).values('recipe_id')),
+    )
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+class Command(BaseCommand):
+    help = ('Выполняет типичные запросы эндпоинтов под EXPLAIN (ANALYZE, '
+            'BUFFERS) на сгенерированных данных и завершается ошибкой, '
+            'если план читает большую таблицу целиком или превышает '
+            'бюджет стоимости. Все изменения откатываются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=5000,
+            help='Сколько пользователей сгенерировать'
+        )
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=50000,
+            help='Сколько рецептов сгенерировать'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0
+        )
+        parser.add_argument(
+            '--existing',
+            action='store_true',
+            help='Проверять на данных, которые уже есть в базе'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Проверка планов работает только с PostgreSQL')
+        failures = []
+        with transaction.atomic():
+            if not options['existing']:
+                generate_dataset(
+                    options['users'], options['recipes'], options['seed']
+                )
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+                for name, budget, queryset in representative_queries():
+                    sql, params = queryset.query.sql_with_params()
+                    cursor.execute(
+                        f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}',
+                        params
+                    )
+                    explain = cursor.fetchone()[0][0]
+                    plan = explain['Plan']
+                    problems = [
+                        f'Seq Scan по {node["Relation Name"]}'
+                        for node in plan_nodes(plan)
+                        if node['Node Type'] == 'Seq Scan'
+                        and node['Relation Name'] in GUARDED_TABLES
+                    ]
+                    if plan['Total Cost'] > budget:
+                        problems.append(
+                            f'стоимость {plan["Total Cost"]} > {budget}'
+                        )
+                    self.stdout.write(
+                        f'{name}: cost={plan["Total Cost"]} '
+                        f'time={explain["Execution Time"]:.2f}ms '
+                        + ('; '.join(problems) or 'OK')
+                    )
+                    if problems:
+                        failures.append(name)
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(
+                'Регрессия планов запросов: ' + ', '.join(failures)
+            )
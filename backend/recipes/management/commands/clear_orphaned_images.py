@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.images import finish_upload
+from recipes.models import ImageUpload, RecipeImage
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки, на которые не ссылается ни один рецепт, и '
+            'старые загрузки картинок по частям.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help=('Удалять картинки без ссылок дольше этого времени: '
+                  'только что загруженную картинку рецепт ещё не сохранил')
+        )
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - timedelta(hours=options['hours'])
+        orphaned = RecipeImage.objects.filter(
+            references=0, updated__lt=deadline
+        )
+        removed = 0
+        for pk in orphaned.values_list('pk', flat=True).iterator():
+            with transaction.atomic():
+                image = orphaned.select_for_update(
+                    skip_locked=True
+                ).filter(pk=pk).first()
+                if image is None:
+                    continue
+                default_storage.delete(image.name)
+                image.delete()
+                removed += 1
+        uploads = 0
+        for upload in ImageUpload.objects.filter(
+                created__lt=deadline).iterator():
+            finish_upload(upload)
+            uploads += 1
+        self.stdout.write(
+            f'Удалено картинок: {removed}, загрузок: {uploads}'
+        )
@@ -0,0 +1,31 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы списков покупок, которые давно не скачивали.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Удалять файлы, не использованные столько дней'
+        )
+
+    def handle(self, *args, **options):
+        deadline = time.time() - options['days'] * 24 * 60 * 60
+        removed = 0
+        for directory, _, files in os.walk(settings.SHOPPING_LIST_ROOT):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < deadline:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        self.stdout.write(f'Удалено файлов списков покупок: {removed}')
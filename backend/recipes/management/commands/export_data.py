@@ -0,0 +1,93 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.export import CHUNK_SIZE, ndjson, recipe_records, user_records
+from users.models import User
+
+READ_BACK = 64 * 1024
+
+
+def resume_position(path):
+    """Id последнего целиком записанного рецепта; обрезает оборванную строку.
+
+    Файл читается с конца, так что продолжение не зависит от его размера.
+    """
+    with open(path, 'r+b') as file:
+        end = file.seek(0, os.SEEK_END)
+        tail = b''
+        position = end
+        while position > 0:
+            position = max(0, position - READ_BACK)
+            file.seek(position)
+            tail = file.read(end - position)
+            lines = tail.split(b'\n')
+            # До первого перевода строки может быть обрезанная строка.
+            complete = lines[1:-1] if position else lines[:-1]
+            if complete:
+                file.truncate(end - len(lines[-1]))
+                return json.loads(complete[-1])['id']
+        file.truncate(0)
+        return 0
+
+
+class Command(BaseCommand):
+    help = ('Выгружает в NDJSON все рецепты или избранное, корзину и '
+            'подписки одного пользователя.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=('recipes', 'user'))
+        parser.add_argument(
+            '--user',
+            help='id или username пользователя для выгрузки user'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки, по умолчанию стандартный вывод'
+        )
+        parser.add_argument(
+            '--after',
+            type=int,
+            default=0,
+            help='Выгружать рецепты с id больше этого'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Продолжить прерванную выгрузку рецептов в --output'
+        )
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        after = options['after']
+        mode = 'w'
+        if options['kind'] == 'user':
+            user = self.get_user(options['user'])
+            records = user_records(user, chunk_size)
+        else:
+            if options['resume']:
+                if not options['output']:
+                    raise CommandError('Для --resume нужен --output')
+                if os.path.exists(options['output']):
+                    after = resume_position(options['output'])
+                    mode = 'a'
+            records = recipe_records(after, chunk_size)
+        if not options['output']:
+            self.stdout.writelines(ndjson(records))
+            return
+        with open(options['output'], mode, encoding='utf-8') as file:
+            file.writelines(ndjson(records))
+
+    @staticmethod
+    def get_user(value):
+        if not value:
+            raise CommandError('Укажите пользователя: --user')
+        users = User.objects.filter(username=value)
+        if value.isdigit():
+            users = users | User.objects.filter(pk=value)
+        user = users.first()
+        if user is None:
+            raise CommandError(f'Пользователь {value} не найден')
+        return user
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.fake_data import FakeDataGenerator
+from recipes.models import Ingredient, Tag
+
+
+class Command(BaseCommand):
+    help = ('Генерирует пользователей, рецепты, избранное, корзины и '
+            'подписки для нагрузочного тестирования.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--favorites', type=int, default=5000000)
+        parser.add_argument('--carts', type=int, default=1000000)
+        parser.add_argument('--subscriptions', type=int, default=1000000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100000,
+            help='Сколько строк писать за один COPY или пачку bulk_create'
+        )
+
+    def handle(self, *args, **options):
+        if not (Ingredient.objects.exists() and Tag.objects.exists()):
+            raise CommandError(
+                'Сначала загрузите ингредиенты и теги: '
+                'python manage.py load_data'
+            )
+        generator = FakeDataGenerator(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            report=self.stdout.write
+        )
+        with transaction.atomic():
+            generator.generate(
+                users=options['users'],
+                recipes=options['recipes'],
+                favorites=options['favorites'],
+                carts=options['carts'],
+                subscriptions=options['subscriptions']
+            )
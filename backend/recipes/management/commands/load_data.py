@@ -3,6 +3,7 @@ import json
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from recipes.catalog import catalog_snapshot, current_version
 from recipes.models import Ingredient, Tag
 
 
@@ -36,3 +37,4 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         read_ingredients()
         read_tags()
+        catalog_snapshot(current_version())
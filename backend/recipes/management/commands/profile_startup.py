@@ -0,0 +1,95 @@
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+# То же, что делает воркер gunicorn до первого запроса: настройка Django,
+# загрузка приложений и URLconf со всеми представлениями.
+STARTUP = (
+    'import time\n'
+    'started = time.perf_counter()\n'
+    'from django.core.wsgi import get_wsgi_application\n'
+    'get_wsgi_application()\n'
+    'from django.urls import get_resolver\n'
+    'get_resolver().url_patterns\n'
+    'print(time.perf_counter() - started)\n'
+)
+
+
+def run_startup(*options):
+    result = subprocess.run(
+        [sys.executable, *options, '-c', STARTUP],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode:
+        raise CommandError(result.stderr)
+    return result
+
+
+def parse_importtime(output):
+    """Время импорта каждого модуля из вывода python -X importtime, мкс."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(own), int(cumulative)))
+    return modules
+
+
+class Command(BaseCommand):
+    help = ('Измеряет холодный старт процесса и показывает, какие '
+            'приложения и модули дольше всего импортируются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Сколько раз запустить процесс для замера холодного старта'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=15,
+            help='Сколько самых долгих пакетов и модулей показать'
+        )
+
+    def handle(self, *args, **options):
+        timings = [
+            float(run_startup().stdout.split()[-1]) * 1000
+            for _ in range(options['repeat'])
+        ]
+        modules = parse_importtime(run_startup('-X', 'importtime').stderr)
+        packages = defaultdict(int)
+        for name, own, _ in modules:
+            packages[name.split('.')[0]] += own
+        applications = {
+            config.label: sum(
+                own for name, own, _ in modules
+                if name == config.name or name.startswith(config.name + '.')
+            )
+            for config in apps.get_app_configs()
+        }
+        for title, totals in (
+            ('Импорт по приложениям (собственное время, мс):', applications),
+            ('Импорт по пакетам (собственное время, мс):', packages),
+        ):
+            self.stdout.write(title)
+            for name, own in sorted(
+                    totals.items(), key=lambda item: -item[1]
+            )[:options['limit']]:
+                self.stdout.write(f'  {name}: {own / 1000:.1f}')
+        self.stdout.write('Самые долгие модули (с зависимостями, мс):')
+        for name, _, cumulative in sorted(
+                modules, key=lambda module: -module[2]
+        )[:options['limit']]:
+            self.stdout.write(f'  {name}: {cumulative / 1000:.1f}')
+        self.stdout.write(
+            f'Холодный старт: медиана {statistics.median(timings):.0f} мс, '
+            f'минимум {min(timings):.0f} мс, запусков {len(timings)}'
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from recipes.models import Recipe
+from recipes.read_model import rebuild_read_model
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает теги и ингредиенты, сохранённые в рецептах для '
+            'чтения одним запросом.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Сколько рецептов обновлять в одной транзакции'
+        )
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Только рецепты, для которых данные ещё не собраны'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if options['missing']:
+            recipes = recipes.filter(rendered__isnull=True)
+        last = recipes.aggregate(last=Max('pk'))['last'] or 0
+        batch = options['batch_size']
+        rebuilt = 0
+        for start in range(0, last, batch):
+            with transaction.atomic():
+                rebuilt += rebuild_read_model(
+                    recipes.filter(pk__gt=start, pk__lte=start + batch)
+                )
+        self.stdout.write(f'Пересобрано рецептов: {rebuilt}')
@@ -0,0 +1,91 @@
+import math
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import ExpressionWrapper, FloatField, Max, Sum, Value
+from django.db.models.functions import Exp, Extract
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Favorite, RecipePopularity, ShoppingCart
+
+HALF_LIFE = timedelta(days=7)
+DECAY = math.log(2) / HALF_LIFE.total_seconds()
+# Оценки считаются относительно постоянной точки отсчёта и поэтому не
+# меняются со временем: пересчитывать нужно только рецепты с новыми
+# добавлениями. Множитель удваивается за HALF_LIFE, float его выдержит
+# примерно до 2043 года, после этого EPOCH сдвигают и запускают --full.
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# Добавление, записанное до прошлого запуска, но закоммиченное после
+# него, должно попасть в следующий запуск.
+SYNC_OVERLAP = timedelta(minutes=5)
+WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingCart, 0.5),
+)
+
+
+def decayed_scores(model, weight, recipe_ids=None):
+    """Сумма весов событий, растущих в 2 раза за HALF_LIFE от EPOCH."""
+    items = model.objects.all()
+    if recipe_ids is not None:
+        items = items.filter(recipe_id__in=recipe_ids)
+    age = ExpressionWrapper(
+        Extract('added', 'epoch') - Value(EPOCH.timestamp()),
+        output_field=FloatField()
+    )
+    return items.values('recipe_id').annotate(
+        score=Sum(Exp(age * DECAY) * weight, output_field=FloatField())
+    ).values_list('recipe_id', 'score')
+
+
+def touched_recipes(since):
+    ids = set()
+    for model, _ in WEIGHTS:
+        ids.update(model.objects.filter(
+            added__gte=since
+        ).values_list('recipe_id', flat=True))
+    return ids
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг популярности рецептов. Запускается '
+            'периодически; без --full пересчитывает только рецепты, '
+            'в которых были новые добавления с прошлого запуска.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать рейтинг всех рецептов заново'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        now = timezone.now()
+        last_run = RecipePopularity.objects.aggregate(
+            last_run=Max('updated')
+        )['last_run']
+
+        if options['full'] or last_run is None:
+            recipe_ids = None
+            RecipePopularity.objects.all().delete()
+        else:
+            recipe_ids = touched_recipes(last_run - SYNC_OVERLAP)
+
+        scores = {}
+        for model, weight in WEIGHTS:
+            for recipe_id, score in decayed_scores(
+                    model, weight, recipe_ids):
+                scores[recipe_id] = scores.get(recipe_id, 0) + score
+
+        RecipePopularity.objects.filter(recipe_id__in=list(scores)).delete()
+        RecipePopularity.objects.bulk_create(
+            [RecipePopularity(
+                recipe_id=recipe_id,
+                score=score,
+                updated=now
+            ) for recipe_id, score in scores.items()],
+            batch_size=1000
+        )
+        self.stdout.write(f'Пересчитан рейтинг рецептов: {len(scores)}')
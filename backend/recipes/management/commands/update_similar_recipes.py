@@ -0,0 +1,136 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from scipy import sparse
+
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+
+TOP_K = 10
+CHUNK_SIZE = 1000
+
+
+def build_matrix():
+    """Матрица рецепт×ингредиент с весами TF-IDF, строки нормированы."""
+    pairs = np.array(
+        list(RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        )),
+        dtype=np.int64
+    ).reshape(-1, 2)
+    recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    _, cols = np.unique(pairs[:, 1], return_inverse=True)
+    frequency = np.bincount(cols)
+    idf = np.log((1 + len(recipe_ids)) / (1 + frequency)) + 1
+    matrix = sparse.csr_matrix(
+        (idf[cols], (rows, cols)),
+        shape=(len(recipe_ids), len(frequency))
+    )
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    return recipe_ids, sparse.diags(1 / norms) @ matrix
+
+
+def top_neighbors(matrix, rows):
+    """Для каждой строки из rows возвращает TOP_K ближайших строк."""
+    transposed = matrix.T.tocsc()
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        similarity = (matrix[chunk] @ transposed).tocsr()
+        for offset, row in enumerate(chunk):
+            begin, end = similarity.indptr[offset:offset + 2]
+            indices = similarity.indices[begin:end]
+            scores = similarity.data[begin:end]
+            keep = indices != row
+            indices, scores = indices[keep], scores[keep]
+            if len(scores) > TOP_K:
+                best = np.argpartition(-scores, TOP_K)[:TOP_K]
+                indices, scores = indices[best], scores[best]
+            order = np.argsort(-scores)
+            yield row, indices[order], scores[order]
+
+
+def affected_rows(matrix, recipe_ids, changed_rows):
+    """Строки, чей список похожих рецептов мог измениться."""
+    referencing = SimilarRecipe.objects.filter(
+        similar_id__in=recipe_ids[changed_rows].tolist()
+    ).values_list('recipe_id', flat=True).distinct()
+    affected = np.isin(recipe_ids, list(referencing))
+    affected[changed_rows] = True
+
+    stored = np.array(
+        list(SimilarRecipe.objects.values('recipe_id').annotate(
+            lowest=Min('score'), total=Count('id')
+        ).filter(total__gte=TOP_K).values_list('recipe_id', 'lowest')),
+        dtype=np.float64
+    ).reshape(-1, 2)
+    thresholds = np.zeros(len(recipe_ids))
+    known = np.isin(stored[:, 0].astype(np.int64), recipe_ids)
+    thresholds[np.searchsorted(
+        recipe_ids, stored[known, 0].astype(np.int64)
+    )] = stored[known, 1]
+
+    transposed = matrix.T.tocsc()
+    for start in range(0, len(changed_rows), CHUNK_SIZE):
+        chunk = changed_rows[start:start + CHUNK_SIZE]
+        best = (matrix[chunk] @ transposed).max(axis=0).toarray().ravel()
+        affected |= best > thresholds
+    return np.flatnonzero(affected)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты по общим ингредиентам. '
+            'Без --full обновляет только рецепты, созданные или '
+            'изменённые с прошлого запуска, и их соседей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать похожие рецепты для всего каталога'
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        now = timezone.now()
+        last_run = SimilarRecipe.objects.aggregate(
+            last_run=Max('updated')
+        )['last_run']
+        recipe_ids, matrix = build_matrix()
+
+        if options['full'] or last_run is None:
+            rows = np.arange(len(recipe_ids))
+            SimilarRecipe.objects.all().delete()
+        else:
+            changed_ids = np.array(
+                list(Recipe.objects.filter(
+                    updated__gte=last_run
+                ).values_list('id', flat=True)),
+                dtype=np.int64
+            )
+            SimilarRecipe.objects.filter(
+                recipe_id__in=changed_ids.tolist()
+            ).delete()
+            changed_rows = np.flatnonzero(np.isin(recipe_ids, changed_ids))
+            rows = affected_rows(matrix, recipe_ids, changed_rows)
+            SimilarRecipe.objects.filter(
+                recipe_id__in=recipe_ids[rows].tolist()
+            ).delete()
+
+        similar = []
+        for row, indices, scores in top_neighbors(matrix, rows):
+            similar.extend(
+                SimilarRecipe(
+                    recipe_id=int(recipe_ids[row]),
+                    similar_id=int(recipe_ids[index]),
+                    score=float(score),
+                    updated=now
+                ) for index, score in zip(indices, scores)
+            )
+            if len(similar) >= CHUNK_SIZE * TOP_K:
+                SimilarRecipe.objects.bulk_create(similar, batch_size=1000)
+                similar = []
+        SimilarRecipe.objects.bulk_create(similar, batch_size=1000)
+        self.stdout.write(
+            f'Пересчитаны похожие рецепты для {len(rows)} рецептов'
+        )
@@ -0,0 +1,57 @@
+from itertools import combinations
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from recipes.models import Tag
+
+
+class Command(BaseCommand):
+    help = ('Прогревает кэш ответов для анонимных пользователей: первые '
+            'страницы списка рецептов для всех сочетаний тегов и рецепты '
+            'с этих страниц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=3,
+            help='Сколько первых страниц прогревать'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=settings.REST_FRAMEWORK['PAGE_SIZE'],
+            help='Размер страницы, как его запрашивает фронтенд'
+        )
+        parser.add_argument(
+            '--host',
+            default=settings.ALLOWED_HOSTS[0] or 'localhost',
+            help='Хост, с которым приходят запросы (входит в ключ кэша)'
+        )
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST=options['host'])
+        slugs = list(Tag.objects.values_list('slug', flat=True))
+        recipe_ids = set()
+        warmed = 0
+        for size in range(len(slugs) + 1):
+            for tags in combinations(slugs, size):
+                for page in range(1, options['pages'] + 1):
+                    response = client.get('/api/recipes/', {
+                        'page': page,
+                        'limit': options['limit'],
+                        'tags': tags
+                    })
+                    if response.status_code != 200:
+                        break
+                    warmed += 1
+                    data = response.json()
+                    recipe_ids.update(item['id'] for item in data['results'])
+                    if not data['next']:
+                        break
+        for recipe_id in recipe_ids:
+            if client.get(f'/api/recipes/{recipe_id}/').status_code == 200:
+                warmed += 1
+        self.stdout.write(f'Прогрето ответов: {warmed}')
@@ -0,0 +1,39 @@
+# Generated by Django 3.2 on 2026-10-19 09:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def log_existing_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientChange = apps.get_model('recipes', 'IngredientChange')
+    IngredientChange.objects.bulk_create(
+        IngredientChange(ingredient_id=ingredient_id)
+        for ingredient_id in Ingredient.objects.values_list('id', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient_id', models.BigIntegerField(verbose_name='Ингредиент')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удалён')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение ингредиента',
+                'verbose_name_plural': 'Изменения ингредиентов',
+            },
+        ),
+        migrations.RunPython(
+            log_existing_ingredients, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-19 09:48
+
+from django.db import migrations
+import recipes.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_rendered'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tag',
+            name='color',
+            field=recipes.fields.ColorField(default='#FF0000', max_length=7, unique=True, verbose_name='Цвет'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2 on 2026-10-19 09:55
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.utils.timezone
+
+
+def count_existing_images(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeImage = apps.get_model('recipes', 'RecipeImage')
+    RecipeImage.objects.bulk_create(
+        RecipeImage(name=image['image'], references=image['references'])
+        for image in Recipe.objects.exclude(image='').values(
+            'image'
+        ).annotate(references=Count('id')).order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_tag_color_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Файл')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Число рецептов')),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Картинка рецепта',
+                'verbose_name_plural': 'Картинки рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipeimage',
+            index=models.Index(condition=models.Q(references=0), fields=['updated'], name='recipe_image_orphaned_idx'),
+        ),
+        migrations.RunPython(
+            count_existing_images, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-19 09:58
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+FILL_INGREDIENT_IDS = '''
+UPDATE recipes_recipe AS r SET ingredient_ids = ARRAY(
+    SELECT ri.ingredient_id FROM recipes_recipeingredient AS ri
+    WHERE ri.recipe_id = r.id ORDER BY ri.ingredient_id
+)
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_image_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, editable=False, size=None, verbose_name='Id ингредиентов'),
+        ),
+        migrations.RunSQL(FILL_INGREDIENT_IDS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ingredient_ids'], name='recipe_ingredient_ids_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+# Счётчик ведёт триггер: избранное меняется и одним SQL-запросом из
+# foods.relations, и каскадным удалением, без сигналов Django.
+FAVORITES_COUNT_TRIGGER = '''
+UPDATE recipes_recipe AS r SET favorites_count = (
+    SELECT COUNT(*) FROM recipes_favorite AS f WHERE f.recipe_id = r.id
+);
+
+CREATE FUNCTION recipes_count_favorites() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE recipes_recipe SET favorites_count = favorites_count + 1
+        WHERE id = NEW.recipe_id;
+    ELSE
+        UPDATE recipes_recipe SET favorites_count = favorites_count - 1
+        WHERE id = OLD.recipe_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_favorite_count
+AFTER INSERT OR DELETE ON recipes_favorite
+FOR EACH ROW EXECUTE FUNCTION recipes_count_favorites();
+'''
+
+DROP_FAVORITES_COUNT_TRIGGER = '''
+DROP TRIGGER recipes_favorite_count ON recipes_favorite;
+DROP FUNCTION recipes_count_favorites();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_ingredient_ids'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunSQL(
+            FAVORITES_COUNT_TRIGGER, DROP_FAVORITES_COUNT_TRIGGER
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cooking_time', '-pub_date'], name='recipe_cooking_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['name', '-pub_date'], name='recipe_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date'], name='recipe_favorites_count_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2 on 2026-10-19 10:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0012_recipe_ordering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('path', models.TextField(verbose_name='Адрес')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Статус')),
+                ('duration', models.FloatField(verbose_name='Длительность, мс')),
+                ('query_count', models.PositiveIntegerField(verbose_name='SQL-запросов')),
+                ('query_duration', models.FloatField(verbose_name='Время SQL, мс')),
+                ('samples', models.PositiveIntegerField(verbose_name='Число замеров')),
+                ('stacks', models.TextField(help_text='Свёрнутые стеки (folded) для flamegraph.pl и speedscope', verbose_name='Стеки')),
+                ('queries', models.JSONField(default=list, verbose_name='SQL-запросы')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request_profiles', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Профиль запроса',
+                'verbose_name_plural': 'Профили запросов',
+                'ordering': ['-created'],
+            },
+        ),
+    ]
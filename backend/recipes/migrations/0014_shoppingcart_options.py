@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-19 12:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='shoppingcart',
+            options={'verbose_name': 'Корзина', 'verbose_name_plural': 'Корзины'},
+        ),
+    ]
@@ -1,7 +1,12 @@
-from colorfield.fields import ColorField
+import uuid
+
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.utils import timezone
 
+from recipes.fields import ColorField
 from users.models import User
 
 
@@ -30,6 +35,23 @@ class Ingredient(models.Model):
         ]
 
 
+class IngredientChange(models.Model):
+    """Журнал изменений каталога ингредиентов, id служит версией."""
+    ingredient_id = models.BigIntegerField(verbose_name='Ингредиент')
+    deleted = models.BooleanField(verbose_name='Удалён', default=False)
+    created = models.DateTimeField(
+        verbose_name='Дата изменения',
+        default=timezone.now
+    )
+
+    class Meta:
+        verbose_name = 'Изменение ингредиента'
+        verbose_name_plural = 'Изменения ингредиентов'
+
+    def __str__(self):
+        return f'{self.id}: {self.ingredient_id}'
+
+
 class Tag(models.Model):
     name = models.CharField(
         max_length=200,
@@ -88,14 +110,84 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
+    rendered = models.JSONField(
+        verbose_name='Теги и ингредиенты для чтения',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    ingredient_ids = ArrayField(
+        models.BigIntegerField(),
+        verbose_name='Id ингредиентов',
+        default=list,
+        blank=True,
+        editable=False
+    )
+
+    # Их пишут триггер избранного и rebuild_read_model; сохранение рецепта
+    # не должно затирать их значениями, прочитанными в начале запроса.
+    derived_fields = ('favorites_count', 'rendered', 'ingredient_ids')
 
     def __str__(self):
         return f'{self.name}, {self.author}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        recipe = super().from_db(db, field_names, values)
+        # По нему сигналы считают ссылки на картинку без лишнего SELECT.
+        if 'image' in field_names:
+            recipe.loaded_image = values[field_names.index('image')]
+        return recipe
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Как и сам Django, не сохраняем отложенные поля (only/defer).
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.derived_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            GinIndex(
+                fields=['ingredient_ids'],
+                name='recipe_ingredient_ids_idx'
+            ),
+            models.Index(
+                fields=['cooking_time', '-pub_date'],
+                name='recipe_cooking_time_idx'
+            ),
+            models.Index(
+                fields=['name', '-pub_date'],
+                name='recipe_name_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date'],
+                name='recipe_favorites_count_idx'
+            ),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -129,6 +221,12 @@ class RecipeIngredient(models.Model):
                 name='unique_ingredients'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='recipe_ingredient_reverse_idx'
+            )
+        ]
 
     def __str__(self):
         return (f'{self.recipe.name}: '
@@ -150,6 +248,11 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Избранный рецепт'
     )
+    added = models.DateTimeField(
+        verbose_name='Дата добавления',
+        default=timezone.now,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -160,6 +263,12 @@ class Favorite(models.Model):
                 name='unique_favorite'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='favorite_recipe_user_idx'
+            )
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -175,6 +284,11 @@ class ShoppingCart(models.Model):
         related_name='shopping_carts',
         verbose_name='Рецепт в корзине'
     )
+    added = models.DateTimeField(
+        verbose_name='Дата добавления',
+        default=timezone.now,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'Корзина'
@@ -185,3 +299,179 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='shopping_cart_recipe_user_idx'
+            )
+        ]
+
+
+class RecipePopularity(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField(
+        verbose_name='Рейтинг',
+        default=0
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата пересчёта',
+        default=timezone.now
+    )
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = [
+            models.Index(fields=['-score'], name='popularity_score_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.score:.3f}'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+    updated = models.DateTimeField(
+        verbose_name='Дата пересчёта',
+        default=timezone.now
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} ~ {self.similar_id}: {self.score:.3f}'
+
+
+class RecipeImage(models.Model):
+    """Файл картинки и число рецептов, которые на него ссылаются."""
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Файл'
+    )
+    references = models.PositiveIntegerField(
+        verbose_name='Число рецептов',
+        default=0
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        default=timezone.now
+    )
+
+    class Meta:
+        verbose_name = 'Картинка рецепта'
+        verbose_name_plural = 'Картинки рецептов'
+        indexes = [
+            models.Index(
+                fields=['updated'],
+                condition=models.Q(references=0),
+                name='recipe_image_orphaned_idx'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.name}: {self.references}'
+
+
+class ImageUpload(models.Model):
+    """Картинка, которую загружают по частям; token заменяет её в рецепте."""
+    token = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name='Пользователь'
+    )
+    filename = models.CharField(
+        max_length=100,
+        verbose_name='Имя файла'
+    )
+    size = models.PositiveIntegerField(verbose_name='Размер')
+    received = models.PositiveIntegerField(
+        verbose_name='Получено байт',
+        default=0
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата создания',
+        default=timezone.now,
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Загрузка картинки'
+        verbose_name_plural = 'Загрузки картинок'
+
+    def __str__(self):
+        return f'{self.token}: {self.received}/{self.size}'
+
+
+class RequestProfile(models.Model):
+    """Профиль одного запроса к API, снятый по просьбе сотрудника."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='request_profiles',
+        verbose_name='Пользователь'
+    )
+    method = models.CharField(max_length=10, verbose_name='Метод')
+    path = models.TextField(verbose_name='Адрес')
+    status_code = models.PositiveSmallIntegerField(verbose_name='Статус')
+    duration = models.FloatField(verbose_name='Длительность, мс')
+    query_count = models.PositiveIntegerField(verbose_name='SQL-запросов')
+    query_duration = models.FloatField(verbose_name='Время SQL, мс')
+    samples = models.PositiveIntegerField(verbose_name='Число замеров')
+    stacks = models.TextField(
+        verbose_name='Стеки',
+        help_text='Свёрнутые стеки (folded) для flamegraph.pl и speedscope'
+    )
+    queries = models.JSONField(verbose_name='SQL-запросы', default=list)
+    created = models.DateTimeField(
+        verbose_name='Дата',
+        default=timezone.now,
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ['-created']
+
+    def __str__(self):
+        return f'{self.method} {self.path}: {self.duration:.0f} мс'
@@ -0,0 +1,52 @@
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+TAG_FIELDS = ('id', 'name', 'slug', 'color')
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit', 'amount')
+
+
+def rebuild_read_model(recipes):
+    """Пересобирает rendered и ingredient_ids рецептов одним UPDATE."""
+    # Вызывается в той же транзакции, что и изменение рецепта.
+    quote = connection.ops.quote_name
+    try:
+        subquery, params = recipes.values('pk').query.sql_with_params()
+    except EmptyResultSet:
+        # Например, pk__in=[] после удаления неиспользуемого тега.
+        return 0
+    tag = quote(Tag._meta.db_table)
+    through = quote(Recipe.tags.through._meta.db_table)
+    ingredient = quote(Ingredient._meta.db_table)
+    amounts = quote(RecipeIngredient._meta.db_table)
+    tags = ', '.join(f"'{field}', t.{quote(field)}" for field in TAG_FIELDS)
+    ingredients = ', '.join(
+        f"'{field}', i.{quote(field)}" for field in INGREDIENT_FIELDS[:-1]
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {quote(Recipe._meta.db_table)} AS r SET rendered = '
+            f'jsonb_build_object('
+            f"'tags', COALESCE(("
+            f'SELECT jsonb_agg(jsonb_build_object({tags}) ORDER BY t.id) '
+            f'FROM {through} AS rt JOIN {tag} AS t ON t.id = rt.tag_id '
+            f"WHERE rt.recipe_id = r.id), '[]'), "
+            f"'ingredients', COALESCE(("
+            f'SELECT jsonb_agg(jsonb_build_object({ingredients}, '
+            f"'amount', ri.amount) ORDER BY ri.id) "
+            f'FROM {amounts} AS ri '
+            f'JOIN {ingredient} AS i ON i.id = ri.ingredient_id '
+            f"WHERE ri.recipe_id = r.id), '[]')"
+            f'), ingredient_ids = ARRAY('
+            f'SELECT ri.ingredient_id FROM {amounts} AS ri '
+            f'WHERE ri.recipe_id = r.id ORDER BY ri.ingredient_id'
+            f') WHERE r.id IN ({subquery})',
+            params
+        )
+        return cursor.rowcount
+
+
+def read_model_items(items, fields):
+    # jsonb хранит ключи в своём порядке, а API отдаёт их в порядке полей.
+    return [{field: item[field] for field in fields} for item in items]
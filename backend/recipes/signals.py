@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save
+)
+from django.dispatch import receiver
+
+from recipes.catalog import catalog_snapshot, current_version
+from recipes.models import Ingredient, IngredientChange, Recipe, Tag
+from recipes.images import release_image, retain_image
+from recipes.read_model import rebuild_read_model
+
+
+def warm_catalog():
+    catalog_snapshot(current_version())
+
+
+@receiver(post_save, sender=Ingredient)
+def log_ingredient_save(sender, instance, **kwargs):
+    IngredientChange.objects.create(ingredient_id=instance.id)
+    transaction.on_commit(warm_catalog)
+
+
+@receiver(post_delete, sender=Ingredient)
+def log_ingredient_delete(sender, instance, **kwargs):
+    IngredientChange.objects.create(ingredient_id=instance.id, deleted=True)
+    transaction.on_commit(warm_catalog)
+
+
+def recipes_using(instance):
+    if isinstance(instance, Ingredient):
+        return Recipe.objects.filter(ingredients=instance)
+    return Recipe.objects.filter(tags=instance)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+def rebuild_recipes_using(sender, instance, created, **kwargs):
+    if not created:
+        rebuild_read_model(recipes_using(instance))
+
+
+@receiver(pre_delete, sender=Ingredient)
+@receiver(pre_delete, sender=Tag)
+def remember_recipes_using(sender, instance, **kwargs):
+    # После каскадного удаления связей рецепты уже не найти.
+    instance.recipes_using = list(
+        recipes_using(instance).values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Tag)
+def rebuild_recipes_used(sender, instance, **kwargs):
+    rebuild_read_model(
+        Recipe.objects.filter(pk__in=instance.recipes_using)
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_image(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if instance._state.adding:
+        instance.previous_image = None
+    elif hasattr(instance, 'loaded_image'):
+        instance.previous_image = instance.loaded_image
+    else:
+        instance.previous_image = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if instance.image.name != instance.previous_image:
+        retain_image(instance.image.name)
+        release_image(instance.previous_image)
+    instance.loaded_image = instance.image.name
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
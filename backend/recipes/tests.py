@@ -0,0 +1,329 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from recipes.catalog import catalog_delta, current_version
+from recipes.ingredient_index import IngredientIndex, cookable_recipes
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeImage,
+    RecipeIngredient,
+    RecipePopularity,
+    ShoppingCart
+)
+from users.models import User
+
+LOCMEM_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        password='password', first_name='Имя', last_name='Фамилия'
+    )
+
+
+def create_recipe(author, name='Рецепт', **kwargs):
+    return Recipe.objects.create(
+        author=author, name=name, text='Описание',
+        image='recipes/media/recipe.png', **kwargs
+    )
+
+
+class RecipeSaveTest(TestCase):
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.recipe = create_recipe(self.author)
+
+    def test_save_keeps_favorite_added_after_load(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        recipe.name = 'Новое название'
+        recipe.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_save_skips_deferred_fields(self):
+        recipe = Recipe.objects.only('id', 'name').get(pk=self.recipe.pk)
+        recipe.name = 'Новое название'
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save()
+        update = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ]
+        self.assertEqual(len(update), 1)
+        self.assertIn('SET "name" = ', update[0])
+        self.assertNotIn('"text"', update[0])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(self.recipe.text, 'Описание')
+
+    def test_save_keeps_read_model(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            rendered={'tags': [], 'ingredients': []}, ingredient_ids=[1]
+        )
+        self.recipe.save()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.ingredient_ids, [1])
+        self.assertIsNotNone(self.recipe.rendered)
+
+
+class RecipeImageReferenceTest(TestCase):
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.recipe = create_recipe(self.author)
+
+    def references(self):
+        return dict(RecipeImage.objects.values_list('name', 'references'))
+
+    def test_loaded_recipe_is_saved_without_image_lookup(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        recipe.name = 'Новое название'
+        with self.assertNumQueries(1):
+            recipe.save()
+        self.assertEqual(self.references(), {'recipes/media/recipe.png': 1})
+
+    def test_image_change_moves_reference(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        recipe.image = 'recipes/media/other.png'
+        recipe.save()
+        recipe.save()
+        self.assertEqual(self.references(), {
+            'recipes/media/recipe.png': 0, 'recipes/media/other.png': 1
+        })
+
+    def test_save_without_image_keeps_references(self):
+        recipe = Recipe.objects.only('id', 'name').get(pk=self.recipe.pk)
+        recipe.name = 'Новое название'
+        with self.assertNumQueries(1):
+            recipe.save()
+        self.assertEqual(self.references(), {'recipes/media/recipe.png': 1})
+
+
+class UpdatePopularityTest(TestCase):
+
+    def setUp(self):
+        self.users = [create_user(f'user{index}') for index in range(3)]
+        self.recipes = [
+            create_recipe(self.users[0], f'Рецепт {index}')
+            for index in range(3)
+        ]
+
+    def update(self, *args):
+        call_command('update_popularity', *args, stdout=StringIO())
+        return dict(RecipePopularity.objects.values_list(
+            'recipe_id', 'updated'
+        ))
+
+    def ranking(self):
+        return list(RecipePopularity.objects.order_by(
+            '-score'
+        ).values_list('recipe_id', flat=True))
+
+    def test_recent_events_rank_higher(self):
+        old = timezone.now() - timedelta(days=14)
+        for user in self.users:
+            Favorite.objects.create(
+                user=user, recipe=self.recipes[0], added=old
+            )
+        Favorite.objects.create(user=self.users[0], recipe=self.recipes[1])
+        ShoppingCart.objects.create(
+            user=self.users[0], recipe=self.recipes[2]
+        )
+        self.update()
+        self.assertEqual(self.ranking(), [
+            self.recipes[1].pk, self.recipes[0].pk, self.recipes[2].pk
+        ])
+
+    def test_incremental_run_writes_only_touched_recipes(self):
+        last_run = timezone.now() - timedelta(hours=1)
+        for recipe in self.recipes[:2]:
+            Favorite.objects.create(
+                user=self.users[0], recipe=recipe,
+                added=last_run - timedelta(hours=1)
+            )
+        first = self.update()
+        RecipePopularity.objects.update(updated=last_run)
+        untouched = RecipePopularity.objects.get(recipe=self.recipes[0])
+        Favorite.objects.create(user=self.users[1], recipe=self.recipes[1])
+        second = self.update()
+        self.assertEqual(set(first), set(second))
+        self.assertEqual(second[self.recipes[0].pk], untouched.updated)
+        self.assertGreater(second[self.recipes[1].pk], untouched.updated)
+        self.assertEqual(self.ranking()[0], self.recipes[1].pk)
+
+    def test_late_commit_inside_overlap_is_counted(self):
+        Favorite.objects.create(user=self.users[0], recipe=self.recipes[0])
+        self.update()
+        Favorite.objects.create(
+            user=self.users[0], recipe=self.recipes[1],
+            added=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertIn(self.recipes[1].pk, self.update())
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class IngredientCatalogTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.salt, self.sugar = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Соль', 'Сахар')
+        )
+        self.version = current_version()
+
+    def test_delta_lists_changed_and_deleted(self):
+        self.salt.name = 'Соль морская'
+        self.salt.save()
+        pepper = Ingredient.objects.create(name='Перец', measurement_unit='г')
+        deleted = self.sugar.id
+        self.sugar.delete()
+        delta = catalog_delta(self.version)
+        self.assertEqual(delta['version'], current_version())
+        self.assertEqual(sorted(delta['changed'], key=lambda i: i['id']), [
+            {'id': self.salt.id, 'name': 'Соль морская',
+             'measurement_unit': 'г'},
+            {'id': pepper.id, 'name': 'Перец', 'measurement_unit': 'г'},
+        ])
+        self.assertEqual(delta['deleted'], [deleted])
+
+    def test_delta_from_current_version_is_empty(self):
+        self.assertEqual(catalog_delta(self.version), {
+            'version': self.version, 'changed': [], 'deleted': []
+        })
+
+    def test_snapshot_is_rebuilt_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salt.save()
+        self.assertIsNotNone(
+            cache.get(f'ingredient_catalog_{current_version()}')
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sugar.delete()
+        self.assertIsNotNone(
+            cache.get(f'ingredient_catalog_{current_version()}')
+        )
+
+
+class IngredientIndexTest(TestCase):
+
+    def setUp(self):
+        author = create_user('author')
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            ) for index in range(4)
+        ]
+        self.recipes = {}
+        for name, used in (('full', (0, 1)), ('one_more', (0, 1, 2)),
+                           ('other', (0, 3))):
+            recipe = create_recipe(author, name)
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=recipe, ingredient=self.ingredients[index]
+                ) for index in used
+            ])
+            self.recipes[name] = recipe
+        # Иначе все рецепты попадут в окно SYNC_OVERLAP первой догрузки.
+        Recipe.objects.update(updated=timezone.now() - timedelta(hours=1))
+        self.have = [self.ingredients[0].id, self.ingredients[1].id]
+        self.index = IngredientIndex()
+        patcher = mock.patch(
+            'recipes.ingredient_index.ingredient_index', self.index
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def found(self, pairs):
+        names = {recipe.id: recipe.name for recipe in self.recipes.values()}
+        return [(names[recipe_id], covered) for recipe_id, covered in pairs]
+
+    def resync(self):
+        self.index._checked = None
+
+    def test_ranked_by_missing_then_covered(self):
+        self.assertEqual(self.found(self.index.search(self.have, 10)), [
+            ('full', 2), ('one_more', 2), ('other', 1)
+        ])
+        self.assertEqual(
+            self.found(self.index.search(self.have, 1)), [('full', 2)]
+        )
+
+    def test_missing_ingredients_are_listed(self):
+        recipes = cookable_recipes(self.have, 10)
+        self.assertEqual(
+            {recipe.name: [item.ingredient for item in recipe.missing]
+             for recipe in recipes},
+            {'full': [], 'one_more': [self.ingredients[2]],
+             'other': [self.ingredients[3]]}
+        )
+
+    @mock.patch('recipes.ingredient_index.REBUILD_RATIO', 1)
+    def test_edited_recipe_leaves_dead_row(self):
+        self.index.search(self.have, 10)
+        recipe = self.recipes['one_more']
+        RecipeIngredient.objects.filter(
+            recipe=recipe, ingredient=self.ingredients[2]
+        ).delete()
+        recipe.save()
+        self.resync()
+        self.assertEqual(self.found(self.index.search(self.have, 10)), [
+            ('full', 2), ('one_more', 2), ('other', 1)
+        ])
+        self.assertEqual(
+            self.index.search([self.ingredients[2].id], 10), []
+        )
+        self.assertEqual(self.index._dead, 1)
+        self.assertEqual(len(self.index._recipe_ids), 4)
+
+    def test_dead_rows_trigger_rebuild(self):
+        self.index.search(self.have, 10)
+        self.recipes['other'].save()
+        self.resync()
+        self.index.search(self.have, 10)
+        self.assertEqual(self.index._dead, 0)
+        self.assertEqual(len(self.index._recipe_ids), 3)
+
+    def test_deleted_recipe_is_discarded(self):
+        self.index.search(self.have, 10)
+        deleted = self.recipes.pop('full')
+        deleted_id = deleted.id
+        deleted.delete()
+        recipes = cookable_recipes(self.have, 10)
+        self.assertEqual(
+            [recipe.name for recipe in recipes], ['one_more', 'other']
+        )
+        self.assertNotIn(deleted_id, self.index._rows)
+
+    def test_database_is_read_outside_the_lock(self):
+        locked = []
+
+        def record(execute, sql, params, many, context):
+            locked.append(self.index._lock.locked())
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            self.index.search(self.have, 10)
+            self.recipes['other'].save()
+            self.resync()
+            self.index.search(self.have, 10)
+        self.assertTrue(locked)
+        self.assertFalse(any(locked))
@@ -43,6 +43,12 @@ class Subscription(models.Model):
                 name='check_author'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='subscription_author_user_idx'
+            )
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 